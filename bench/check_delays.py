@@ -0,0 +1,203 @@
+"""
+Check "calculate_delay" (and, if NumPy is installed, the batch
+"calculate_delays") against the original day-by-day loop it replaced,
+which is kept here as the reference, on randomized start times, end times,
+priorities, and sites. The times are drawn mostly around the edges that
+matter: weekends, holidays, closures, the start and end of the duty day,
+year ends, and end times before the start time (negative spans). Some
+pairs use a site with its own duty day.
+
+Usage: python bench/check_delays.py [--pairs N] [--seed N]
+
+Exits with an error, listing the first few mismatches, if any pair gives
+a different delay.
+
+"""
+
+import argparse
+import datetime
+from datetime import timedelta
+import random
+import sys
+
+from common import load_script
+
+
+w2c = load_script()
+
+# A site with a duty day of its own, and the closures (on top of the
+# holidays) the check runs with.
+OTHER_SITE = "Check Site"
+OTHER_DUTY_DAY = {"start": datetime.time(hour = 5, minute = 30),
+                  "end": datetime.time(hour = 18, minute = 45)}
+CLOSURES = [datetime.date(2020, 3, 13), datetime.date(2021, 8, 6),
+            datetime.date(2021, 12, 27), datetime.date(2022, 5, 2)]
+FIRST_YEAR = 2019
+LAST_YEAR = 2023
+
+
+def reference_delay(start, end, priority, duty_day):
+    """
+    The original "calculate_delay", which adds up the duty days between
+    the start and end dates one at a time. Only the holiday check (which
+    now includes closures) and the duty day (which can now differ between
+    sites) are passed in; the arithmetic is unchanged.
+
+    """
+
+    is_holiday = w2c.is_holiday
+
+    if not w2c.MTRF_RULES[priority]["duty day"]:
+        delay = end - start
+
+    else:
+        if start.time() > duty_day["end"] or start.isoweekday() >= 6 or \
+          is_holiday(start):
+            delay = timedelta(0)
+
+        else:
+            if start.time() < duty_day["start"]:
+                start = datetime.datetime.combine(start.date(),
+                                                  duty_day["start"])
+            if end.date() == start.date() and end.time() < duty_day["end"]:
+                delay = max(end - start, timedelta(0))
+            else:
+                delay = \
+                    datetime.datetime.combine(start.date(), duty_day["end"]) - \
+                    start
+
+        if end.date() > start.date():
+            arb_date = datetime.date(1, 1, 1)
+            duty_time = datetime.datetime.combine(arb_date, duty_day["end"]) - \
+                        datetime.datetime.combine(arb_date, duty_day["start"])
+            if end.time() > duty_day["start"] and start.isoweekday() <= 5 and \
+              not is_holiday(end):
+                if end.time() > duty_day["end"]:
+                    delay += duty_time
+                else:
+                    delay += end - datetime.datetime.combine(end.date(),
+                                                             duty_day["start"])
+
+            if end.date() >= (start + timedelta(days = 2)).date():
+                current_full_day = start.date() + timedelta(days = 1)
+                while current_full_day < end.date():
+                    if current_full_day.isoweekday() <= 5 and \
+                      not is_holiday(current_full_day):
+                        delay += duty_time
+                    current_full_day += timedelta(days = 1)
+
+    return delay.total_seconds() / 3600
+
+
+def boundary_days():
+    """
+    Return the dates around which the random times are mostly drawn: the
+    holidays and closures, the weekends next to them, and the year ends,
+    each with the days either side.
+
+    """
+
+    days = set()
+    edges = [day for day in
+             (datetime.date.fromordinal(ordinal) for ordinal
+              in w2c._holiday_index["ordinals"])
+             if FIRST_YEAR <= day.year <= LAST_YEAR]
+    edges += [datetime.date(year, 12, 31)
+              for year in range(FIRST_YEAR, LAST_YEAR)]
+    for day in edges:
+        for offset in range(-3, 4):
+            days.add(day + timedelta(days = offset))
+    return sorted(days)
+
+
+def random_time(rng, days, duty_day):
+    """
+    Return a random time: usually on one of "days", otherwise on any day
+    in the range, and usually right at (or a minute either side of) the
+    start or end of the duty day, or midnight.
+
+    """
+
+    if rng.random() < 0.7:
+        day = rng.choice(days)
+    else:
+        day = datetime.date(FIRST_YEAR, 1, 1) + \
+              timedelta(days = rng.randrange(365 * (LAST_YEAR - FIRST_YEAR)))
+    if rng.random() < 0.6:
+        edge = rng.choice([duty_day["start"], duty_day["end"],
+                           datetime.time(0)])
+        moment = datetime.datetime.combine(day, edge) + \
+                 timedelta(minutes = rng.choice([-1, 0, 0, 1]))
+    else:
+        moment = datetime.datetime.combine(day, datetime.time(0)) + \
+                 timedelta(minutes = rng.randrange(24 * 60))
+    return moment
+
+
+def random_pairs(count, seed):
+    """
+    Return "count" random (start, end, priority, site) tuples. About one
+    end time in ten is before its start time.
+
+    """
+
+    rng = random.Random(seed)
+    days = boundary_days()
+    priorities = list(w2c.MTRF_RULES)
+    pairs = []
+    for _ in range(count):
+        site = OTHER_SITE if rng.random() < 0.3 else None
+        duty_day = w2c.duty_day_for(site)
+        start = random_time(rng, days, duty_day)
+        roll = rng.random()
+        if roll < 0.1:
+            end = start - timedelta(minutes = rng.randrange(1, 3 * 24 * 60))
+        elif roll < 0.4:
+            end = random_time(rng, days, duty_day)
+        else:
+            end = start + timedelta(minutes = rng.randrange(40 * 24 * 60))
+        pairs.append((start, end, rng.choice(priorities), site))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = "Check calculate_delay against the original "
+                      "day-by-day loop.")
+    parser.add_argument("--pairs", type = int, default = 100000)
+    parser.add_argument("--seed", type = int, default = 1)
+    arguments = parser.parse_args()
+
+    w2c.SITE_DUTY_DAYS = {OTHER_SITE: OTHER_DUTY_DAY}
+    w2c.add_closures(CLOSURES)
+    w2c._index_holiday_years(range(FIRST_YEAR, LAST_YEAR + 1))
+
+    pairs = random_pairs(arguments.pairs, arguments.seed)
+    expected = [reference_delay(start, end, priority, w2c.duty_day_for(site))
+                for start, end, priority, site in pairs]
+    results = {"calculate_delay": [w2c.calculate_delay(*pair)
+                                   for pair in pairs]}
+    try:
+        import numpy
+    except ImportError:
+        print("NumPy isn't installed; skipping calculate_delays.")
+    else:
+        starts, ends, priorities, sites = zip(*pairs)
+        results["calculate_delays"] = w2c.calculate_delays(
+            starts, ends, w2c.duty_day_flags(priorities), sites).tolist()
+
+    failed = False
+    for name, delays in results.items():
+        mismatches = [(pair, want, got) for pair, want, got
+                      in zip(pairs, expected, delays) if want != got]
+        print("%-17s %d pairs, %d mismatches" % (name, len(pairs),
+                                                 len(mismatches)))
+        for pair, want, got in mismatches[:5]:
+            print("  %r: expected %r, got %r" % (pair, want, got))
+        failed = failed or bool(mismatches)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Helpers shared by the benchmarks.
+
+"""
+
+import importlib.util
+from os.path import dirname, join
+
+
+SCRIPT = join(dirname(dirname(__file__)), "src", "word-2-excel.py")
+
+
+def load_script():
+    """
+    Import "src/word-2-excel.py" (which can't be imported by name, because
+    of the hyphens) as a module.
+
+    """
+
+    spec = importlib.util.spec_from_file_location("word2csv", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size of this process, in MB, or None if
+    it can't be measured on this platform.
+
+    """
+
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 2 ** 20
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # "ru_maxrss" is in bytes on macOS, and in KB elsewhere.
+    if sys.platform == "darwin":
+        return peak / 2 ** 20
+    return peak / 2 ** 10
@@ -0,0 +1,184 @@
+"""
+Generate synthetic ticket DOCX files (or ZIP files of them) in the format
+the script expects: a "Details" table, an "Updates" table with one
+"changed the status of" cell per status change (newest first), and a
+"Generated:" line in footer1.xml.
+
+Usage: python bench/make_tickets.py OUTPUT [--tickets N] [--updates N]
+                                    [--split-runs N] [--seed N]
+
+If OUTPUT ends in ".docx", a single ticket is written; otherwise, a ZIP
+file with "--tickets" ticket files is written.
+
+"""
+
+import argparse
+import datetime
+from datetime import timedelta
+from io import BytesIO
+import random
+from xml.sax.saxutils import escape
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from common import load_script
+
+
+w2c = load_script()
+
+W_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+STATUSES = ["Open", "Assigned", "In Progress", "Suspended", "Resolved",
+            "Closed"]
+UPDATERS = ["Jane Roe", "John Doe", "Alex Smith", "Sam Jones"]
+STATUS_NOTES = ["Awaiting parts", "Customer unavailable"]
+
+
+def _split(text, pieces):
+    """
+    Split "text" into (at most) "pieces" roughly equal, non-empty strings,
+    the way Word sometimes splits one line over several text runs.
+
+    """
+
+    pieces = max(1, min(pieces, len(text)))
+    size = -(-len(text) // pieces)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _paragraph(strings):
+    runs = "".join('<w:r><w:t xml:space="preserve">' + escape(string) +
+                   '</w:t></w:r>' for string in strings)
+    return "<w:p>" + runs + "</w:p>"
+
+
+def _details_row(label, value):
+    return ("<w:tr><w:tc>" + _paragraph([label]) + "</w:tc><w:tc>" +
+            _paragraph([value]) + "</w:tc></w:tr>")
+
+
+def _update_cell(updater, from_status, to_status, note, entry_time,
+                 effective_time, split_runs):
+    """
+    Build the table row for one status change. The status-change phrase
+    itself is always kept in a single text run, since that's what the
+    script searches for.
+
+    """
+
+    status_change = " " + w2c.STATUS_CHANGE_PHRASE
+    tail = " this case"
+    if from_status:
+        tail += w2c.FROM_SEP + from_status
+    tail += w2c.TO_SEP + to_status
+    if note:
+        tail += " (" + note + ")"
+    status_strings = [updater + " (ACME)" + status_change] + \
+        _split(tail, split_runs - 1 if split_runs > 1 else 1)
+
+    time_string = entry_time.strftime(w2c.TIME_FORMAT)
+    if effective_time != entry_time:
+        time_string += w2c.EFFECTIVE_TIME_SEP + \
+            effective_time.strftime(w2c.TIME_FORMAT) + ")"
+
+    return ("<w:tr><w:tc>" + _paragraph(status_strings) +
+            _paragraph(["Work notes for this update."]) +
+            _paragraph(_split(time_string, split_runs)) + "</w:tc></w:tr>")
+
+
+def make_ticket(ticket_number, updates=20, split_runs=2, rng=None):
+    """
+    Return the bytes of a synthetic ticket DOCX file with "updates" status
+    changes, with the status and time lines split over "split_runs" text
+    runs.
+
+    """
+
+    rng = rng or random.Random(ticket_number)
+    priority = rng.choice(sorted(w2c.MTRF_RULES))
+    contract = rng.choice(w2c.CONTRACT_PREFIXES) + "Site " + \
+        str(rng.randrange(1, 9))
+
+    cells = []
+    effective_time = datetime.datetime(2021, 1, 4, 6) + \
+        timedelta(minutes = rng.randrange(0, 60 * 24 * 365))
+    from_status = None
+    for _ in range(updates):
+        to_status = rng.choice([status for status in STATUSES
+                                if status != from_status])
+        note = rng.choice(STATUS_NOTES) if rng.random() < 0.1 else None
+        entry_time = effective_time
+        if rng.random() < 0.3:
+            entry_time += timedelta(minutes = rng.randrange(1, 60 * 24))
+        cells.append(_update_cell(rng.choice(UPDATERS), from_status,
+                                  to_status, note, entry_time,
+                                  effective_time, split_runs))
+        from_status = to_status
+        effective_time += timedelta(minutes = rng.randrange(1, 60 * 24 * 5))
+
+    # Updates are listed newest first.
+    cells.reverse()
+
+    body = (_paragraph(["Case Report"]) + _paragraph([w2c.DETAILS_TITLE]) +
+            "<w:tbl>" +
+            _details_row(w2c.TICKET_LABEL, "CASE-%06d" % ticket_number) +
+            _details_row(w2c.CONTRACT_LABEL, contract) +
+            _details_row(w2c.PRIORITY_LABEL, priority) + "</w:tbl>" +
+            _paragraph([w2c.UPDATES_TITLE]) +
+            "<w:tbl>" + "".join(cells) + "</w:tbl>")
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="' + W_NAMESPACE + '"><w:body>' + body +
+                '</w:body></w:document>')
+    # The script finds the report time by its prefix, so the prefix stays
+    # at the start of the first text run.
+    report_time = effective_time + timedelta(days = 1)
+    report_time_strings = _split(report_time.strftime(w2c.TIME_FORMAT),
+                                 split_runs)
+    report_time_strings[0] = w2c.REPORT_TIME_PREFIX + report_time_strings[0]
+    footer = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+              '<w:ftr xmlns:w="' + W_NAMESPACE + '">' +
+              _paragraph(report_time_strings) + '</w:ftr>')
+
+    docx = BytesIO()
+    with ZipFile(docx, "w", ZIP_DEFLATED) as word_file:
+        word_file.writestr("word/document.xml", document)
+        word_file.writestr("word/footer1.xml", footer)
+    return docx.getvalue()
+
+
+def make_ticket_archive(filename, tickets=100, updates=20, split_runs=2,
+                        seed=0):
+    """
+    Write a ZIP file of "tickets" synthetic ticket files, in a directory, as
+    the ticket system exports them.
+
+    """
+
+    rng = random.Random(seed)
+    with ZipFile(filename, "w") as archive:
+        for ticket_number in range(tickets):
+            archive.writestr("tickets/CASE-%06d.docx" % ticket_number,
+                             make_ticket(ticket_number, updates, split_runs,
+                                         rng))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = "Generate synthetic ticket DOCX/ZIP files.")
+    parser.add_argument("output")
+    parser.add_argument("--tickets", type = int, default = 100)
+    parser.add_argument("--updates", type = int, default = 20)
+    parser.add_argument("--split-runs", type = int, default = 2)
+    parser.add_argument("--seed", type = int, default = 0)
+    arguments = parser.parse_args()
+
+    if arguments.output.lower().endswith(".docx"):
+        with open(arguments.output, "wb") as docx:
+            docx.write(make_ticket(arguments.seed, arguments.updates,
+                                   arguments.split_runs))
+    else:
+        make_ticket_archive(arguments.output, arguments.tickets,
+                            arguments.updates, arguments.split_runs,
+                            arguments.seed)
+
+
+if __name__ == "__main__":
+    main()
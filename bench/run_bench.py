@@ -0,0 +1,161 @@
+"""
+Benchmark the stages of a ZIP run: reading the ticket files out of the ZIP
+file, "parse_ticket", "calculate_delay" (and, if NumPy is installed, the
+batch "fill_delays", which is checked against it), and the CSV writers.
+Reports the throughput (tickets/s), the time per stage, and the peak RSS,
+and can save the results as JSON to compare runs.
+
+Usage: python bench/run_bench.py [--archive FILE | --tickets N --updates N
+                                  --split-runs N] [--streaming]
+                                 [--repeat N] [--json FILE]
+
+Without "--archive", a synthetic ZIP file is generated (see
+"make_tickets.py") in a temporary directory.
+
+"""
+
+import argparse
+from io import BytesIO
+import json
+from os.path import join
+import platform
+import tempfile
+from time import perf_counter
+from zipfile import ZipFile
+
+from common import load_script, peak_rss_mb
+from make_tickets import make_ticket_archive
+
+
+w2c = load_script()
+
+
+def run_stages(archive_filename, output_dir, streaming=False):
+    """
+    Run the stages of a ZIP run one after another, timing each. Returns a
+    dict of results.
+
+    """
+
+    timings = {"read": 0.0, "parse": 0.0, "calculate_delay": 0.0,
+               "write CSV": 0.0}
+    ticket_times = []
+    details_list = []
+    all_updates = []
+    tickets = []
+
+    input_file = ZipFile(archive_filename)
+    for zipped_file in input_file.filelist:
+        if not zipped_file.filename.lower().endswith(".docx"):
+            continue
+
+        start = perf_counter()
+        member_bytes = input_file.read(zipped_file.filename)
+        read_done = perf_counter()
+        details, updates_list = w2c.parse_ticket(ZipFile(BytesIO(member_bytes)),
+                                                 streaming)
+        parse_done = perf_counter()
+        timings["read"] += read_done - start
+        timings["parse"] += parse_done - read_done
+        ticket_times.append(parse_done - start)
+
+        details_list.append(details)
+        tickets.append((details, updates_list))
+        all_updates.extend((details.ticket, update) for update in updates_list)
+
+    # "calculate_delay" runs inside "parse_ticket"; we time it separately
+    # by repeating the same calls.
+    priorities = {details.ticket: details.priority
+                  for details in details_list}
+    start = perf_counter()
+    previous_ticket = previous = None
+    for ticket, update in all_updates:
+        priority = priorities[ticket]
+        if previous_ticket == ticket:
+            w2c.calculate_delay(previous.effective_time,
+                                update.effective_time, priority)
+        w2c.calculate_delay(update.effective_time, update.entry_time,
+                            priority)
+        previous_ticket, previous = ticket, update
+    timings["calculate_delay"] = perf_counter() - start
+
+    # The batch version, for the whole archive at once. It must give
+    # exactly the same results as "parse_ticket".
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        expected = [(update.status_hours, update.update_delay)
+                    for _, update in all_updates]
+        start = perf_counter()
+        w2c.fill_delays(tickets)
+        timings["fill_delays"] = perf_counter() - start
+        if expected != [(update.status_hours, update.update_delay)
+                        for _, update in all_updates]:
+            raise AssertionError("fill_delays doesn't match calculate_delay")
+
+    start = perf_counter()
+    w2c.write_details_CSV(join(output_dir, "bench_details.csv"), details_list)
+    w2c.write_updates_CSV(join(output_dir, "bench_updates.csv"), all_updates)
+    timings["write CSV"] = perf_counter() - start
+
+    ticket_times.sort()
+    total = timings["read"] + timings["parse"] + timings["write CSV"]
+    return {"tickets": len(details_list), "updates": len(all_updates),
+            "total seconds": total,
+            "tickets per second": len(details_list) / total if total else 0,
+            "stage seconds": timings,
+            "ticket ms (median)":
+                1000 * ticket_times[len(ticket_times) // 2],
+            "ticket ms (max)": 1000 * ticket_times[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = "Benchmark the stages of a ZIP run.")
+    parser.add_argument("--archive",
+                        help = "ZIP file of tickets to use instead of a "
+                               "generated one")
+    parser.add_argument("--tickets", type = int, default = 200)
+    parser.add_argument("--updates", type = int, default = 30)
+    parser.add_argument("--split-runs", type = int, default = 2)
+    parser.add_argument("--streaming", action = "store_true")
+    parser.add_argument("--repeat", type = int, default = 3,
+                        help = "number of runs (the fastest is reported)")
+    parser.add_argument("--json", help = "save the results to this file")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        archive_filename = arguments.archive
+        if not archive_filename:
+            archive_filename = join(output_dir, "bench.zip")
+            make_ticket_archive(archive_filename, arguments.tickets,
+                                arguments.updates, arguments.split_runs)
+        runs = [run_stages(archive_filename, output_dir, arguments.streaming)
+                for _ in range(arguments.repeat)]
+
+    results = min(runs, key = lambda run: run["total seconds"])
+    results["peak RSS MB"] = peak_rss_mb()
+    results["python"] = platform.python_version()
+    results["parameters"] = {key: value for key, value
+                             in vars(arguments).items() if key != "json"}
+
+    print("Tickets:            %d (%d updates)" % (results["tickets"],
+                                                   results["updates"]))
+    print("Throughput:         %.1f tickets/s" %
+          results["tickets per second"])
+    for stage, seconds in results["stage seconds"].items():
+        print("  %-16s %8.3f s" % (stage, seconds))
+    print("Per ticket:         %.2f ms median, %.2f ms max" %
+          (results["ticket ms (median)"], results["ticket ms (max)"]))
+    if results["peak RSS MB"] is not None:
+        print("Peak RSS:           %.1f MB" % results["peak RSS MB"])
+
+    if arguments.json:
+        with open(arguments.json, "w") as json_file:
+            json.dump(results, json_file, indent = 2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Measure the cold-start time of a single-ticket run: the script under the
+current Python interpreter, compared with the packaged executable (from
+"create_exe.sh") if it has been built, and with an empty interpreter run
+for reference. Each command is run several times, and the fastest and
+median wall times are reported.
+
+Usage: python bench/startup_time.py [--runs N] [--executable PATH]
+
+"""
+
+import argparse
+from os.path import dirname, exists, join
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+from common import SCRIPT
+from make_tickets import make_ticket
+
+
+def time_command(command, runs):
+    """
+    Run "command" "runs" times, returning the wall times, in seconds,
+    sorted.
+
+    """
+
+    times = []
+    for _ in range(runs):
+        started = perf_counter()
+        subprocess.run(command, stdout = subprocess.DEVNULL, check = True)
+        times.append(perf_counter() - started)
+    return sorted(times)
+
+
+def main():
+    default_executable = join(dirname(dirname(__file__)), "dist",
+                              "word-2-excel" +
+                              (".exe" if sys.platform == "win32" else ""))
+    parser = argparse.ArgumentParser(
+        description = "Measure the cold-start time of a single-ticket run.")
+    parser.add_argument("--runs", type = int, default = 10)
+    parser.add_argument("--executable", default = default_executable,
+                        help = "packaged executable to compare (default: "
+                               "%(default)s)")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        ticket_filename = join(output_dir, "ticket.docx")
+        with open(ticket_filename, "wb") as ticket_file:
+            ticket_file.write(make_ticket(0, updates = 10))
+
+        commands = {"python (empty)": [sys.executable, "-c", "pass"],
+                    "script": [sys.executable, SCRIPT, ticket_filename]}
+        if exists(arguments.executable):
+            commands["executable"] = [arguments.executable, ticket_filename]
+        else:
+            print("No executable at " + arguments.executable +
+                  " (run create_exe.sh to build it)")
+
+        print("%-16s %10s %10s" % ("", "min (ms)", "median (ms)"))
+        for name, command in commands.items():
+            times = time_command(command, arguments.runs)
+            print("%-16s %10.1f %10.1f" % (name, 1000 * times[0],
+                                           1000 * times[len(times) // 2]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark for the table locator in "parse_ticket": compares the
+original approach (XPath strings built by concatenation and re-parsed for
+every body child, with two descendant scans per child to find the table
+titles, and one per row label) with the precompiled queries now used by
+the script, and times "parse_ticket" on the same ticket.
+
+Usage: python bench/xpath_locator.py [number of updates] [repetitions]
+
+"""
+
+from io import BytesIO
+import sys
+from timeit import timeit
+from zipfile import ZipFile
+
+import lxml.etree as ET
+
+from make_tickets import make_ticket, w2c
+
+
+def locate_concatenated(body, ns):
+    """
+    The original locator: fresh XPath strings for every child and label,
+    and two title scans per child.
+
+    """
+
+    details_found = updates_found = False
+    for child in body:
+        if details_found:
+            for label in (w2c.TICKET_LABEL, w2c.CONTRACT_LABEL,
+                          w2c.PRIORITY_LABEL):
+                row = child.xpath('.//w:tr[descendant::*[text() = "' + label +
+                                  '"]]', namespaces = ns)
+                cells = row[0].xpath(".//w:tc", namespaces = ns)
+                cells[1].xpath(".//w:t", namespaces = ns)
+        details_found = child.xpath('.//w:t[text()="' + w2c.DETAILS_TITLE +
+                                    '"]', namespaces = ns)
+        if updates_found:
+            return child.xpath('.//w:tc[descendant::*[contains(text(), "' +
+                               w2c.STATUS_CHANGE_PHRASE + '")]]',
+                               namespaces = ns)
+        updates_found = child.xpath('.//w:t[text()="' + w2c.UPDATES_TITLE +
+                                    '"]', namespaces = ns)
+
+
+def locate_precompiled(body):
+    """
+    The current locator, built from the script's own helpers.
+
+    """
+
+    details_found = updates_found = False
+    for child in body:
+        if details_found:
+            w2c._parse_details_table(child)
+        if updates_found:
+            return w2c._find_update_cells(child)
+        details_found, updates_found = w2c._find_titles(child)
+
+
+def main():
+    update_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    docx = make_ticket(1, update_count)
+    root = ET.fromstring(ZipFile(BytesIO(docx)).read("word/document.xml"))
+    body = root.find("w:body", namespaces = root.nsmap)
+    assert len(locate_concatenated(body, root.nsmap)) == \
+        len(locate_precompiled(body)) == update_count
+
+    concatenated = timeit(lambda: locate_concatenated(body, root.nsmap),
+                          number = repetitions) / repetitions
+    precompiled = timeit(lambda: locate_precompiled(body),
+                         number = repetitions) / repetitions
+    full = timeit(lambda: w2c.parse_ticket(ZipFile(BytesIO(docx))),
+                  number = repetitions) / repetitions
+
+    print("Updates per ticket:    %d" % update_count)
+    print("Concatenated XPath:    %8.1f us/ticket" % (concatenated * 1e6))
+    print("Precompiled XPath:     %8.1f us/ticket" % (precompiled * 1e6))
+    print("Locator speedup:       %8.2fx" % (concatenated / precompiled))
+    print("parse_ticket (total):  %8.1f us/ticket" % (full * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -22,7 +22,12 @@ pip install -r requirements.txt
 if ! [[ -d dist ]]; then
 	mkdir dist
 fi
-pyinstaller --onefile --hidden-import docx2txt --distpath dist src/word-2-excel.py
+# The optional packages for Parquet/Arrow output are left out: a one-file
+# executable unpacks everything it contains on every launch, so they would
+# slow down every run.
+pyinstaller --onefile --hidden-import docx2txt --exclude-module pyarrow \
+	--exclude-module numpy --exclude-module pandas --distpath dist \
+	src/word-2-excel.py
 
 # Deactivate the virtual environment.
 deactivate
@@ -1,3 +1,12 @@
+# For "--startup-timing", we note when the script started, before any
+# imports.
+from time import perf_counter
+STARTUP_TIMES = {"script started": perf_counter()}
+
+# Startup time matters for single-ticket runs, so the heavier modules that
+# only some runs need (e.g., "holidays", "sqlite3", and the multiprocessing
+# modules) are imported where they're used, not here.
+import argparse
 import csv
 from sys import argv, stdout
 import sys
@@ -5,13 +14,20 @@ from time import sleep
 import re
 import datetime # We avoid direct imports of classes with confusing names.
 from datetime import timedelta
-from zipfile import ZipFile
-from os.path import splitext
+from zipfile import ZipFile, ZIP_STORED
+from os import stat, fstat, remove, cpu_count
+from os.path import splitext, isdir, join, basename, exists, abspath, normcase
 from io import BytesIO
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from operator import attrgetter, eq
+from time import time
 
-import holidays
 import lxml.etree as ET
 
+STARTUP_TIMES["imports done"] = perf_counter()
+
 
 # Set constants. To make it easier to deploy the app, as a single file,
 # everything is hard-coded here, but to facilitate changes, everything is
@@ -44,18 +60,655 @@ MTRF_RULES = {"PL1: Catastrophic Failure": {"hours": 12, "duty day": False},
               "PL4: Major Malfunction": {"hours": 24, "duty day": True},
               "PL4: Partial Failure": {"hours": 24, "duty day": True}}
 DUTY_DAY = {"start": datetime.time(hour = 7), "end": datetime.time(hour = 16)}
-HOLIDAYS = holidays.UnitedStates()
-SUSPEND_STATUSES = ["Suspended"]
+# Sites whose duty day differs from "DUTY_DAY", each with its own "start"
+# and "end" times, e.g., {"Site 1": {"start": datetime.time(hour = 6),
+# "end": datetime.time(hour = 18)}}.
+SITE_DUTY_DAYS = {}
+HOLIDAY_CALENDAR = "UnitedStates" # A calendar in the "holidays" package
+SUSPEND_STATUSES = frozenset(["Suspended"])
+DETAILS_CSV_HEADER = ['Ticket No.', 'Site', 'Priority', 'Report Date']
+UPDATES_CSV_HEADER = ['Ticket No.', 'Entered By', 'Entered On',
+                      'From Status', 'To Status', 'Status Note',
+                      'Effective Time', 'Status Hours', 'Update Delay']
+COMPLIANCE_CSV_HEADER = ['Ticket No.', 'Site', 'Priority', 'Clock Hours',
+                         'MTRF Hours', 'Breached', 'Status Mismatches']
+COMPLIANCE_SUMMARY_HEADER = ['Summary', 'Group', 'Tickets', 'Breached',
+                             'Breach Rate', 'Total Clock Hours',
+                             'Mean Clock Hours']
+REJECTS_CSV_HEADER = ['Ticket File', 'Error']
+CSV_BUFFER_SIZE = 1024 * 1024 # bytes
+CSV_FLUSH_INTERVAL = 100 # tickets
+CHECKPOINT_INTERVAL = 100 # tickets between checkpoints of a ZIP run
+JOURNAL_FILE_SUFFIX = "_journal.jsonl"
+REJECTS_FILE_SUFFIX = "_rejects.csv"
+WATCH_INTERVAL = 2 # seconds between polls in watch mode
+WATCH_QUEUE_SIZE = 16 # files found but not yet processed, in watch mode
+ARROW_BATCH_TICKETS = 1000 # tickets per record batch in Parquet/Arrow files
+OUTPUT_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrows"}
+TIME_CACHE_SIZE = 4096 # distinct time strings remembered by "parse_time"
+PIPELINE_QUEUE_SIZE = 8 # tickets held between two stages of the pipeline
+PIPELINE_POLL_INTERVAL = 0.1 # seconds between checks for an aborted run
+CACHE_FILE_SUFFIX = "_cache.sqlite"
+CACHE_MAX_SIZE = 512 * 1024 * 1024 # bytes
+# Bump this whenever a change to the parser changes its output, so that
+# stale results are dropped from existing caches.
+CACHE_VERSION = 5
+# Compiled config files (see "load_config") are cached next to the config
+# file, under its name plus this suffix.
+CONFIG_CACHE_SUFFIX = ".compiled"
+
+# The XPath queries we run on every ticket are compiled once, here; the
+# titles, labels, and phrases they look for are passed in as XPath
+# variables when they're run.
+W_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W_NS = {"w": W_NAMESPACE}
+W_P = "{" + W_NAMESPACE + "}p"
+W_T = "{" + W_NAMESPACE + "}t"
+LABELLED_ROWS_QUERY = ET.XPath(".//w:tr[descendant::*[text() = $ticket or "
+                               "text() = $contract or text() = $priority]]",
+                               namespaces = W_NS)
+ROW_TEXT_QUERY = ET.XPath("descendant::*/text()")
+ROW_VALUE_QUERY = ET.XPath("(.//w:tc)[2]//w:t/text()", namespaces = W_NS)
+UPDATE_CELLS_QUERY = ET.XPath(".//w:tc[.//w:t[contains(text(), $phrase)]]",
+                              namespaces = W_NS)
+REPORT_TIME_QUERY = ET.XPath(".//w:p[descendant::*"
+                             "[starts-with(text(), $prefix)]]",
+                             namespaces = W_NS)
+
+
+def _contract_prefix_patt(prefixes):
+    """
+    Combine the contract prefixes into a single regex that matches any of
+    them at the start of a contract string. Each prefix is a group of its
+    own, so the match's "lastindex" tells which one matched; where more
+    than one could match, the first in the list wins.
+
+    """
+
+    return re.compile("|".join("(" + re.escape(prefix) + ")"
+                               for prefix in prefixes))
+
+
+CONTRACT_PREFIX_PATT = _contract_prefix_patt(CONTRACT_PREFIXES)
+
+
+class Details:
+    """
+    The details of a ticket: its number, site, and priority, from the
+    details table, and the report time, from the footer.
+
+    """
+
+    # With "__slots__", there's no per-instance dict, which matters when
+    # we're holding many thousands of these at once.
+    __slots__ = ("ticket", "site", "priority", "report_time")
+
+    def __init__(self, ticket, site, priority, report_time=None):
+        self.ticket = ticket
+        self.site = site
+        self.priority = priority
+        self.report_time = report_time
+
+    def __repr__(self):
+        return "Details(%r, %r, %r, %r)" % (self.ticket, self.site,
+                                             self.priority, self.report_time)
+
+
+class Update:
+    """
+    A single status change from a ticket's updates table. "status_hours"
+    and "update_delay" are filled in by "parse_ticket", once the updates
+    are in order.
+
+    """
+
+    __slots__ = ("updater", "entry_time", "from_status", "to_status",
+                 "status_note", "effective_time", "status_hours",
+                 "update_delay")
+
+    def __init__(self, updater, entry_time, from_status, to_status,
+                 status_note, effective_time, status_hours=None,
+                 update_delay=None):
+        self.updater = updater
+        self.entry_time = entry_time
+        self.from_status = from_status
+        self.to_status = to_status
+        self.status_note = status_note
+        self.effective_time = effective_time
+        self.status_hours = status_hours
+        self.update_delay = update_delay
+
+    def __repr__(self):
+        return ("Update(%r, %r, %r, %r, %r, %r, %r, %r)"
+                % (self.updater, self.entry_time, self.from_status,
+                   self.to_status, self.status_note, self.effective_time,
+                   self.status_hours, self.update_delay))
+
+
+# The holiday index used for every holiday check: the ordinals (see
+# "datetime.date.toordinal") of the holidays in "HOLIDAY_CALENDAR", for
+# each year that has been needed so far, plus any site-specific closures. A
+# year is added to the index (in one go) the first time a date in that year
+# is checked. The calendar itself is only loaded then, too, since loading
+# it is slow, and only priorities that count the duty day need it.
+_holiday_index = {"calendar": None, "years": set(), "ordinals": frozenset(),
+                  "closures": frozenset(), "array": (None, None)}
+
+
+def _load_holiday_calendar():
+    """
+    Import the "holidays" package and create the holiday calendar.
+
+    """
+
+    started = perf_counter()
+    import holidays
+    _holiday_index["calendar"] = getattr(holidays, HOLIDAY_CALENDAR)()
+    STARTUP_TIMES["holiday calendar"] = perf_counter() - started
+
+
+def _index_holiday_years(years):
+    """
+    Add the holidays in "years" to the holiday index.
+
+    """
+
+    if _holiday_index["calendar"] is None:
+        _load_holiday_calendar()
+    calendar = _holiday_index["calendar"]
+    ordinals = set(_holiday_index["ordinals"])
+    for year in years:
+
+        # Checking a date makes the calendar fill in the holidays for its
+        # year.
+        datetime.date(year, 1, 1) in calendar
+        ordinals.update(day.toordinal() for day in calendar
+                        if day.year == year)
+        _holiday_index["years"].add(year)
+    _holiday_index["ordinals"] = frozenset(ordinals)
+
+
+def add_closures(closures):
+    """
+    Treat the dates in "closures" (site-specific closures, e.g., base
+    closures or local holidays) as holidays.
+
+    """
+
+    _holiday_index["closures"] = _holiday_index["closures"] | \
+        frozenset(day.toordinal() for day in closures)
+    _holiday_index["ordinals"] = _holiday_index["ordinals"] | \
+        _holiday_index["closures"]
+
+    # The business-day calendar may already have counted these days as
+    # duty days.
+    _duty_calendar["first"] = None
+
+
+def load_closures(filename):
+    """
+    Read a list of closure dates from a text file: one date per line, in
+    "YYYY-MM-DD" format. Blank lines, and anything after a "#", are
+    ignored.
+
+    """
+
+    closures = []
+    with open(filename) as _file:
+        for line in _file:
+            line = line.split("#")[0].strip()
+            if line:
+                closures.append(datetime.date.fromisoformat(line))
+    return closures
+
+
+# The config loaded with "--config" (see "load_config"), if any. It's
+# kept so that it can be passed on to worker processes.
+_loaded_config = {"config": None}
+
+# The text settings in a config file, and the constants they set.
+CONFIG_LABELS = {"details_title": "DETAILS_TITLE",
+                 "ticket_label": "TICKET_LABEL",
+                 "contract_label": "CONTRACT_LABEL",
+                 "priority_label": "PRIORITY_LABEL",
+                 "updates_title": "UPDATES_TITLE",
+                 "status_change_phrase": "STATUS_CHANGE_PHRASE",
+                 "report_time_prefix": "REPORT_TIME_PREFIX",
+                 "time_format": "TIME_FORMAT"}
+
+
+def _compile_duty_day(setting, name):
+    """
+    Convert a duty day from a config file ("start" and "end" times, in
+    "HH:MM" format) to a dict of "datetime.time" values.
+
+    """
+
+    if not isinstance(setting, dict) or set(setting) != {"start", "end"}:
+        raise ValueError(name + ' needs a "start" and an "end" time')
+    duty_day = {key: datetime.time.fromisoformat(str(setting[key]))
+                for key in ("start", "end")}
+    if duty_day["start"] >= duty_day["end"]:
+        raise ValueError(name + " ends before it starts")
+    return duty_day
+
+
+def compile_config(settings):
+    """
+    Check the settings read from a config file, and convert them to the
+    form the script uses: the contract prefixes in order, the suspend
+    statuses as a frozenset, the MTRF rules keyed by priority, and the
+    duty days (the default one and any per-site ones) as "datetime.time"
+    values. Settings that aren't given keep their built-in values; MTRF
+    rules are added to (or replace) the built-in ones, one priority at a
+    time.
+
+    """
+
+    config = {}
+    for key, value in settings.items():
+        if key in CONFIG_LABELS:
+            if not isinstance(value, str) or not value:
+                raise ValueError(key + " must be a non-empty string")
+            config[key] = value
+        elif key == "contract_prefixes":
+            if not isinstance(value, list) or not value or \
+              not all(isinstance(prefix, str) and prefix
+                      for prefix in value):
+                raise ValueError(key + " must be a list of non-empty "
+                                 "strings")
+            config[key] = list(value)
+        elif key == "suspend_statuses":
+            if not isinstance(value, list) or \
+              not all(isinstance(status, str) for status in value):
+                raise ValueError(key + " must be a list of strings")
+            config[key] = frozenset(value)
+        elif key == "mtrf_rules":
+            if not isinstance(value, dict):
+                raise ValueError(key + " must map priorities to rules")
+            config[key] = {}
+            for priority, rule in value.items():
+                if not isinstance(rule, dict) or \
+                  set(rule) != {"hours", "duty_day"} or \
+                  not isinstance(rule["hours"], (int, float)) or \
+                  not isinstance(rule["duty_day"], bool):
+                    raise ValueError('The MTRF rule for "' + priority +
+                                     '" needs "hours" (a number) and '
+                                     '"duty_day" (true or false)')
+                config[key][priority] = {"hours": rule["hours"],
+                                         "duty day": rule["duty_day"]}
+        elif key == "duty_day":
+            config[key] = _compile_duty_day(value, "duty_day")
+        elif key == "site_duty_days":
+            if not isinstance(value, dict):
+                raise ValueError(key + " must map sites to duty days")
+            config[key] = {site: _compile_duty_day(duty_day, 'The duty day '
+                                                   'for "' + site + '"')
+                           for site, duty_day in value.items()}
+        else:
+            raise ValueError("Unknown setting: " + key)
+    return config
+
+
+def apply_config(config):
+    """
+    Replace the built-in settings with those from a compiled config (see
+    "compile_config").
+
+    """
+
+    global CONTRACT_PREFIXES, CONTRACT_PREFIX_PATT, SUSPEND_STATUSES
+    global MTRF_RULES, DUTY_DAY, SITE_DUTY_DAYS
+
+    for key, constant in CONFIG_LABELS.items():
+        if key in config:
+            globals()[constant] = config[key]
+    if "time_format" in config:
+        parse_time.cache_clear()
+    if "contract_prefixes" in config:
+        CONTRACT_PREFIXES = config["contract_prefixes"]
+        CONTRACT_PREFIX_PATT = _contract_prefix_patt(CONTRACT_PREFIXES)
+    if "suspend_statuses" in config:
+        SUSPEND_STATUSES = config["suspend_statuses"]
+    if "mtrf_rules" in config:
+        MTRF_RULES = dict(MTRF_RULES, **config["mtrf_rules"])
+    if "duty_day" in config:
+        DUTY_DAY = config["duty_day"]
+    if "site_duty_days" in config:
+        SITE_DUTY_DAYS = config["site_duty_days"]
+    _loaded_config["config"] = config
+
+
+def load_config(filename):
+    """
+    Read a config file, in JSON or (with a ".toml" extension) TOML format,
+    and return it compiled (see "compile_config").
+
+    The compiled config is cached next to the config file, so that later
+    runs skip the parsing and checks (and, for TOML, the import of the
+    TOML parser). The cache is used only while the config file's contents
+    are unchanged, which is checked by their CRC and size. If the cache
+    can't be written, the config is simply compiled again next time.
+
+    """
+
+    import pickle
+    import zlib
+
+    with open(filename, "rb") as _file:
+        source = _file.read()
+    fingerprint = "%08x-%d" % (zlib.crc32(source), len(source))
+    cache_filename = filename + CONFIG_CACHE_SUFFIX
+    try:
+        with open(cache_filename, "rb") as _file:
+            cached = pickle.load(_file)
+        if cached["version"] == CACHE_VERSION and \
+          cached["config"]["fingerprint"] == fingerprint:
+            return cached["config"]
+    except Exception:
+        pass
+
+    if splitext(filename)[-1].lower() == ".toml":
+        import tomllib
+        settings = tomllib.loads(source.decode("utf-8"))
+    else:
+        import json
+        settings = json.loads(source)
+    if not isinstance(settings, dict):
+        raise ValueError("The config file must hold a set of settings")
+    config = compile_config(settings)
+    config["fingerprint"] = fingerprint
+
+    try:
+        with open(cache_filename, "wb") as _file:
+            pickle.dump({"version": CACHE_VERSION, "config": config}, _file,
+                        pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+    return config
+
+
+def _init_worker(closures, config):
+    """
+    Set up a worker process with the closures and config loaded in the
+    main process.
+
+    """
+
+    if config is not None:
+        apply_config(config)
+    add_closures(closures)
+
+
+def is_holiday(day):
+    """
+    Check whether a date (or datetime) is a holiday or closure.
+
+    """
+
+    if day.year not in _holiday_index["years"]:
+        _index_holiday_years([day.year])
+    return day.toordinal() in _holiday_index["ordinals"]
+
+
+# The business-day calendar used by "calculate_delay": "cumulative" holds,
+# for each date from "first" onward, the number of duty days before that
+# date, so the duty time between any two dates is a single subtraction
+# (times the length of the duty day, which can differ between sites). It's
+# built on first use, and rebuilt (in whole years) whenever a date falls
+# outside the range it covers.
+_duty_calendar = {"first": None, "last": None, "cumulative": []}
+
+
+def _build_duty_calendar(first_date, last_date):
+    """
+    Build the business-day calendar so that it covers every date from
+    "first_date" through "last_date", extending whatever range it already
+    covers.
+
+    """
+
+    if _duty_calendar["first"] is not None:
+        first_date = min(first_date, _duty_calendar["first"])
+        last_date = max(last_date, _duty_calendar["last"])
+    first_date = datetime.date(first_date.year, 1, 1)
+    last_date = datetime.date(last_date.year, 12, 31)
+
+    # The list has one more entry than there are days, so that the entry
+    # for the day after "last_date" is available as an upper bound.
+    cumulative = [0]
+    current_day = first_date
+    while current_day <= last_date:
+        if current_day.isoweekday() <= 5 and not is_holiday(current_day):
+            cumulative.append(cumulative[-1] + 1)
+        else:
+            cumulative.append(cumulative[-1])
+        current_day += timedelta(days = 1)
+
+    _duty_calendar["first"] = first_date
+    _duty_calendar["last"] = last_date
+    _duty_calendar["cumulative"] = cumulative
+
+
+def duty_day_for(site):
+    """
+    Return the duty day (a dict of "start" and "end" times) for "site":
+    its entry in "SITE_DUTY_DAYS", if it has one, or "DUTY_DAY".
+
+    """
+
+    return SITE_DUTY_DAYS.get(site, DUTY_DAY)
+
+
+def duty_time_between(first_date, end_date, duty_day=None):
+    """
+    Return the total duty time of the duty days (weekdays that aren't
+    holidays) from "first_date" up to, but not including, "end_date", for
+    the given duty day ("DUTY_DAY" by default).
+
+    """
+
+    if end_date <= first_date:
+        return timedelta(0)
+    if _duty_calendar["first"] is None or \
+      first_date < _duty_calendar["first"] or \
+      end_date > _duty_calendar["last"] + timedelta(days = 1):
+        _build_duty_calendar(first_date, end_date)
+    cumulative = _duty_calendar["cumulative"]
+    offset = _duty_calendar["first"].toordinal()
+    duty_days = cumulative[end_date.toordinal() - offset] - \
+                cumulative[first_date.toordinal() - offset]
+
+    duty_day = duty_day or DUTY_DAY
+    arb_date = datetime.date(1, 1, 1)
+    return duty_days * (datetime.datetime.combine(arb_date, duty_day["end"]) -
+                        datetime.datetime.combine(arb_date, duty_day["start"]))
+
+
+# The run profile, when "--profile" is used (see "start_profiling"). It
+# stays None otherwise, so that each instrumented stage costs no more than
+# a check of this variable.
+PROFILE = None
+PROFILE_OUTLIERS = 10 # The number of slowest tickets to report
+
+
+def start_profiling():
+    """
+    Start recording the wall time and number of calls for each stage of
+    the run, in total and per ticket.
+
+    """
+
+    # Each thread has its own current ticket, since in a pipelined run,
+    # the stages run in different threads, each on a different ticket.
+    from threading import local
+    global PROFILE
+    PROFILE = {"stages": {}, "current ticket": local(), "tickets": [],
+               "pipeline": [], "started": perf_counter()}
+
+
+def _ticket_stages():
+    """
+    Return the stages recorded so far for this thread's current ticket.
+
+    """
+
+    current_ticket = PROFILE["current ticket"]
+    if not hasattr(current_ticket, "stages"):
+        current_ticket.stages = {}
+    return current_ticket.stages
+
+
+def take_ticket_profile():
+    """
+    Return the stages recorded for this thread's current ticket, and their
+    total time, as a (seconds, stages) pair, and start a new ticket.
+
+    """
+
+    stages = _ticket_stages()
+    PROFILE["current ticket"].stages = {}
+    return sum(seconds for seconds, _ in stages.values()), stages
+
+
+def combine_ticket_profiles(first, second):
+    """
+    Combine two (seconds, stages) profiles of parts of the same ticket
+    (e.g., reading it and parsing it, in different threads).
+
+    """
+
+    stages = {stage: list(totals) for stage, totals in first[1].items()}
+    for stage, (stage_seconds, calls) in second[1].items():
+        stage_totals = stages.setdefault(stage, [0.0, 0])
+        stage_totals[0] += stage_seconds
+        stage_totals[1] += calls
+    return first[0] + second[0], stages
+
+
+def profile_stage(stage, started, per_ticket=True):
+    """
+    Record a call to "stage" that started at "started" (a "perf_counter"
+    value) and has just finished. Unless "per_ticket" is False, the call
+    is counted as part of this thread's current ticket.
+
+    """
+
+    if per_ticket:
+        stage_totals = _ticket_stages().setdefault(stage, [0.0, 0])
+    else:
+        stage_totals = PROFILE["stages"].setdefault(stage, [0.0, 0])
+    stage_totals[0] += perf_counter() - started
+    stage_totals[1] += 1
+
+
+def _current_ticket_seconds():
+    """
+    Return the total time recorded for this thread's current ticket so far.
+
+    """
 
+    return sum(seconds for seconds, _ in _ticket_stages().values())
 
-def calculate_delay(start, end, priority):
+
+def finish_ticket_profile(ticket_name, seconds, ticket_stages=None):
+    """
+    Add the stages recorded in this thread since the last ticket (or
+    "ticket_stages", for a ticket parsed in a worker process or another
+    thread) to the totals, and record the time taken by the ticket.
+
+    """
+
+    if ticket_stages is None:
+        _, ticket_stages = take_ticket_profile()
+    for stage, (stage_seconds, calls) in ticket_stages.items():
+        stage_totals = PROFILE["stages"].setdefault(stage, [0.0, 0])
+        stage_totals[0] += stage_seconds
+        stage_totals[1] += calls
+    PROFILE["tickets"].append((seconds, ticket_name, ticket_stages))
+
+
+def report_profile(profile_filename):
+    """
+    Print a summary table of the stages and the slowest tickets, and save
+    the full profile as JSON.
+
+    """
+
+    # Anything recorded outside a ticket (e.g., writing the CSV files) is
+    # added to the totals here.
+    finish_ticket_profile(None, 0.0)
+    PROFILE["tickets"].pop()
+    wall_time = perf_counter() - PROFILE["started"]
+
+    tickets = sorted(PROFILE["tickets"], reverse = True)
+    ticket_times = sorted(ticket[0] for ticket in tickets)
+
+    print("\nStage                 Calls    Total (s)   Mean (ms)   % of run")
+    for stage, (seconds, calls) in sorted(PROFILE["stages"].items(),
+                                          key = lambda item: -item[1][0]):
+        print("%-20s %7d %12.3f %11.3f %9.1f%%" %
+              (stage, calls, seconds, 1000 * seconds / calls,
+               100 * seconds / wall_time))
+    print("Run (wall time)              %12.3f" % wall_time)
+    if ticket_times:
+        print("\n%d tickets: median %.1f ms, 95th percentile %.1f ms, "
+              "max %.1f ms" %
+              (len(ticket_times), 1000 * ticket_times[len(ticket_times) // 2],
+               1000 * ticket_times[int(len(ticket_times) * 0.95)],
+               1000 * ticket_times[-1]))
+        print("Slowest tickets:")
+        for seconds, ticket_name, _ in tickets[:PROFILE_OUTLIERS]:
+            print("  %10.1f ms  %s" % (1000 * seconds, ticket_name))
+
+    # For a pipelined run, how full each queue between the stages got, and
+    # how long the stages on either side spent waiting on it: a producer
+    # waits when the queue is full (the next stage is the bottleneck), and
+    # a consumer when it's empty (the previous stage is).
+    if PROFILE["pipeline"]:
+        print("\nQueue     Size    Items  Mean depth  Max depth  "
+              "Producer waits (s)  Consumer waits (s)")
+        for queue_stats in PROFILE["pipeline"]:
+            print("%-8s %5d %8d %11.1f %10d %19.3f %19.3f" %
+                  (queue_stats["name"], queue_stats["size"],
+                   queue_stats["items"], queue_stats["mean depth"],
+                   queue_stats["max depth"], queue_stats["producer waits"],
+                   queue_stats["consumer waits"]))
+
+    import json
+    with open(profile_filename, mode='w') as _file:
+        json.dump({"wall seconds": wall_time,
+                   "stages": {stage: {"seconds": seconds, "calls": calls}
+                              for stage, (seconds, calls)
+                              in PROFILE["stages"].items()},
+                   "tickets": [{"name": ticket_name, "seconds": seconds,
+                                "stages": {stage: {"seconds": stage_seconds,
+                                                   "calls": calls}
+                                           for stage, (stage_seconds, calls)
+                                           in ticket_stages.items()}}
+                               for seconds, ticket_name, ticket_stages
+                               in tickets],
+                   "pipeline": PROFILE["pipeline"]},
+                  _file, indent = 1)
+    print("\nProfile saved to " + profile_filename)
+
+
+def calculate_delay(start, end, priority, site=None):
     """
-    Note that, at present, we don't use the "hours" values from
-    "MTRF_RULES"--we're simply calculating the times between status
-    changes, not comparing them to a metric.
+    Return the delay (in hours) from "start" to "end" for a ticket of the
+    given priority at the given site (which sets the duty day; see
+    "duty_day_for").
+
+    Note that we don't use the "hours" values from "MTRF_RULES" here--we're
+    simply calculating the times between status changes. The totals for
+    each ticket are compared to the "hours" values afterwards (see
+    "ticket_compliance").
 
     """
 
+    if PROFILE:
+        started = perf_counter()
+
     # If we have to include weekends, holidays, and time outside the duty
     # day in the delay between status changes, our calculation is simple.
     if not MTRF_RULES[priority]["duty day"]:
@@ -65,13 +718,14 @@ def calculate_delay(start, end, priority):
     # duty day, things get much more complex.
 
     else:
+        duty_day = duty_day_for(site)
 
         # First, we deal with the start date of the status period. If the
         # start date was on a weekend or holiday, or the start time was
         # after the end of the duty day, we don't record any time for
         # this day.
-        if start.time() > DUTY_DAY["end"] or start.isoweekday() >= 6 or \
-          start in HOLIDAYS:
+        if start.time() > duty_day["end"] or start.isoweekday() >= 6 or \
+          is_holiday(start):
             delay = timedelta(0)
 
         # Otherwise, we record only time during the duty day.
@@ -79,9 +733,9 @@ def calculate_delay(start, end, priority):
 
             # If the period started before the duty day, reset "start"
             # to the beginning of the duty day.
-            if start.time() < DUTY_DAY["start"]:
+            if start.time() < duty_day["start"]:
                 start = datetime.datetime.combine(start.date(),
-                                                  DUTY_DAY["start"])
+                                                  duty_day["start"])
 
             # If the end of the status period was on the same day and
             # occured before the end of the duty day, we subtract the start
@@ -89,14 +743,14 @@ def calculate_delay(start, end, priority):
             # update and the start update occurred before the start of the
             # duty day, in which case "end - start" calculation will
             # produce a negative number, which we'll correct to 0.
-            if end.date() == start.date() and end.time() < DUTY_DAY["end"]:
+            if end.date() == start.date() and end.time() < duty_day["end"]:
                 delay = max(end - start, timedelta(0))
 
             # If the end update occurred after the duty day, we use the
             # end of the duty day to calculate time for the first day.
             else:
                 delay = \
-                    datetime.datetime.combine(start.date(), DUTY_DAY["end"]) - \
+                    datetime.datetime.combine(start.date(), duty_day["end"]) - \
                     start
 
             # of the duty day
@@ -109,44 +763,275 @@ def calculate_delay(start, end, priority):
             # this is slightly complex because we can't perform arithmetic
             # on the "datetime.time" class.
             arb_date = datetime.date(1, 1, 1)
-            duty_time = datetime.datetime.combine(arb_date, DUTY_DAY["end"]) - \
-                        datetime.datetime.combine(arb_date, DUTY_DAY["start"])
+            duty_time = datetime.datetime.combine(arb_date, duty_day["end"]) - \
+                        datetime.datetime.combine(arb_date, duty_day["start"])
 
             # We'll only add time for the end date if the end date was not
             # on a weekend or holiday, and the end time was not before the
             # beginning of the duty day.
-            if end.time() > DUTY_DAY["start"] and start.isoweekday() <= 5 and \
-              end not in HOLIDAYS:
+            if end.time() > duty_day["start"] and start.isoweekday() <= 5 and \
+              not is_holiday(end):
 
                 # We add the difference between the beginning of the duty
                 # day and the end time, or, if the end occurs after the
                 # duty day, we add the length of the duty day.
-                if end.time() > DUTY_DAY["end"]:
+                if end.time() > duty_day["end"]:
                     delay += duty_time
                 else:
                     delay += end - datetime.datetime.combine(end.date(),
-                                                             DUTY_DAY["start"])
+                                                             duty_day["start"])
 
             # If the end date was at least two days after the start date
             # (meaning there's at least one full day in between), we need
-            # to account for the days between the start and end updates.
-            if end.date() >= (start + timedelta(days = 2)).date():
-
-                # For each day that's not a weekend or holiday, wee add the
-                # entire duty day to the total.
-                current_full_day = start.date() + timedelta(days = 1)
-                while current_full_day < end.date():
-                    if current_full_day.isoweekday() <= 5 and \
-                      current_full_day not in HOLIDAYS:
-                        delay += duty_time
-                    current_full_day += timedelta(days = 1)
+            # to account for the days between the start and end updates:
+            # we add the entire duty day for each day that's not a weekend
+            # or holiday, which we look up in the business-day calendar.
+            delay += duty_time_between(start.date() + timedelta(days = 1),
+                                       end.date(), duty_day)
 
     # Express the delay in hours.
     delay_hours = delay.total_seconds() / 3600
 
+    if PROFILE:
+        profile_stage("calculate_delay", started)
+
+    return delay_hours
+
+
+def _holiday_array(first_year, last_year):
+    """
+    Return the holidays and closures from "first_year" through
+    "last_year" as a sorted NumPy array of dates, for the NumPy business
+    day functions.
+
+    """
+
+    import numpy as np
+
+    missing_years = [year for year in range(first_year, last_year + 1)
+                     if year not in _holiday_index["years"]]
+    if missing_years:
+        _index_holiday_years(missing_years)
+
+    # The array is kept until the index changes. NumPy counts days from
+    # 1970-01-01, not from 0001-01-01.
+    ordinals, holidays = _holiday_index["array"]
+    if ordinals is not _holiday_index["ordinals"]:
+        ordinals = _holiday_index["ordinals"]
+        epoch = datetime.date(1970, 1, 1).toordinal()
+        days = np.array(sorted(ordinals), dtype = np.int64)
+        holidays = (days - epoch).astype("datetime64[D]")
+        _holiday_index["array"] = (ordinals, holidays)
+    return holidays
+
+
+def _datetime64_array(times):
+    """
+    Convert a sequence of datetimes to a NumPy array of datetimes, in
+    microseconds.
+
+    """
+
+    import numpy as np
+
+    if isinstance(times, np.ndarray):
+        return times.astype("datetime64[us]")
+
+    # NumPy's own conversion of "datetime" objects is several times slower
+    # than this.
+    epoch = datetime.datetime(1970, 1, 1)
+    microsecond = timedelta(microseconds = 1)
+    return np.fromiter(((time - epoch) // microsecond for time in times),
+                       dtype = np.int64, count = len(times)
+                       ).astype("datetime64[us]")
+
+
+def _time_microseconds(day_time):
+    """
+    Return a "datetime.time" as microseconds since midnight.
+
+    """
+
+    return (day_time.hour * 3600 + day_time.minute * 60 +
+            day_time.second) * 1000000 + day_time.microsecond
+
+
+def calculate_delays(starts, ends, duty_day, sites=None):
+    """
+    A batch version of "calculate_delay": return a NumPy array with the
+    delay (in hours) between each of "starts" and the matching one of
+    "ends", where "duty_day" holds, for each pair, whether only time during
+    the duty day counts (see "duty_day_flags"). The times can be lists of
+    datetimes, or NumPy datetime arrays. If "sites" is given, it holds the
+    site of each pair, for the sites in "SITE_DUTY_DAYS".
+
+    This gives exactly the same results as "calculate_delay", quirks and
+    all, which stays the reference implementation. It needs NumPy.
+
+    """
+
+    import numpy as np
+
+    if PROFILE:
+        started = perf_counter()
+
+    # All the arithmetic is done in whole microseconds, as "timedelta"
+    # does, so the results match to the last bit.
+    starts = _datetime64_array(starts)
+    ends = _datetime64_array(ends)
+    duty_day = np.asarray(duty_day, dtype = bool)
+    delays = (ends - starts).astype(np.int64)
+
+    if duty_day.any():
+        start = starts[duty_day]
+        end = ends[duty_day]
+        start_day = start.astype("datetime64[D]")
+        end_day = end.astype("datetime64[D]")
+        start_time = (start - start_day).astype(np.int64)
+        end_time = (end - end_day).astype(np.int64)
+
+        # Unless some sites have a duty day of their own, it's the same for
+        # every pair.
+        if sites is not None and SITE_DUTY_DAYS:
+            duty_days = [duty_day_for(site) for site, counts
+                         in zip(sites, duty_day) if counts]
+            day_start = np.fromiter((_time_microseconds(day["start"])
+                                     for day in duty_days),
+                                    dtype = np.int64, count = len(duty_days))
+            day_end = np.fromiter((_time_microseconds(day["end"])
+                                   for day in duty_days),
+                                  dtype = np.int64, count = len(duty_days))
+        else:
+            day_start = _time_microseconds(DUTY_DAY["start"])
+            day_end = _time_microseconds(DUTY_DAY["end"])
+        years = np.concatenate((start_day, end_day)) \
+                  .astype("datetime64[Y]").astype(np.int64) + 1970
+        holidays = _holiday_array(int(years.min()), int(years.max()))
+
+        # The start date: nothing if it's a weekend or holiday, or the
+        # period started after the duty day. Otherwise, the time from the
+        # start (or the beginning of the duty day) to the end of the
+        # period, if that's before the end of the duty day on the same
+        # date, or to the end of the duty day.
+        start_counts = (start_time <= day_end) & \
+                       np.is_busday(start_day, holidays = holidays)
+        start_time = np.maximum(start_time, day_start)
+        first_day = np.where((end_day == start_day) & (end_time < day_end),
+                             np.maximum(end_time - start_time, 0),
+                             day_end - start_time)
+        delays[duty_day] = np.where(start_counts, first_day, 0)
+
+        # The end date, for periods that end on a later date. As in
+        # "calculate_delay", it's the start date that's checked for a
+        # weekend (1970-01-01 was a Thursday).
+        later = end_day > start_day
+        start_weekday = (start_day.astype(np.int64) + 3) % 7
+        end_counts = later & (end_time > day_start) & (start_weekday < 5) & \
+                     ~np.isin(end_day, holidays)
+        last_day = np.where(end_counts,
+                            np.minimum(end_time, day_end) - day_start, 0)
+
+        # The full duty days in between.
+        days_between = np.where(later,
+                                np.busday_count(start_day + 1,
+                                                np.maximum(end_day,
+                                                           start_day + 1),
+                                                holidays = holidays), 0)
+        delays[duty_day] += last_day + days_between * (day_end - day_start)
+
+    # Express the delays in hours.
+    delay_hours = delays / 1e6 / 3600
+
+    if PROFILE:
+        profile_stage("calculate_delays", started)
+
     return delay_hours
 
 
+def duty_day_flags(priorities):
+    """
+    Return, for each of "priorities", whether its delays count only time
+    during the duty day, for "calculate_delays".
+
+    """
+
+    return [MTRF_RULES[priority]["duty day"] for priority in priorities]
+
+
+def fill_delays(tickets):
+    """
+    Fill in the status hours and update delays for all the updates in
+    "tickets" (a list of details and updates pairs, with each ticket's
+    updates already in order), with a single call to "calculate_delays".
+    The results are the same as those from "parse_ticket".
+
+    """
+
+    # Each update needs up to two delays: the status hours since the
+    # previous update, and the update delay. We collect both sets of pairs
+    # in one list, and note which updates need status hours.
+    starts = []
+    ends = []
+    priorities = []
+    sites = []
+    status_updates = []
+    for details, updates_list in tickets:
+        old_update = None
+        for update in updates_list:
+            if not old_update:
+                update.status_hours = 0
+            elif update.from_status != old_update.to_status:
+                update.status_hours = "Status mismatch!"
+            elif update.from_status in SUSPEND_STATUSES:
+                update.status_hours = 0
+            else:
+                starts.append(old_update.effective_time)
+                ends.append(update.effective_time)
+                priorities.append(details.priority)
+                sites.append(details.site)
+                status_updates.append(update)
+            old_update = update
+    update_delays_from = len(starts)
+    for details, updates_list in tickets:
+        for update in updates_list:
+            starts.append(update.effective_time)
+            ends.append(update.entry_time)
+            priorities.append(details.priority)
+            sites.append(details.site)
+    if not starts:
+        return
+
+    delays = calculate_delays(starts, ends, duty_day_flags(priorities),
+                              sites).tolist()
+    for update, delay in zip(status_updates, delays):
+        update.status_hours = delay
+    update_delays = iter(delays[update_delays_from:])
+    for _, updates_list in tickets:
+        for update in updates_list:
+            update.update_delay = next(update_delays)
+
+
+def ticket_compliance(details, updates_list):
+    """
+    Total the clock hours of a ticket (the status hours of its updates,
+    which are already 0 for time spent in one of "SUSPEND_STATUSES"), and
+    compare them to the MTRF hours for its priority. Returns the clock
+    hours, the MTRF hours, whether the MTRF hours were exceeded, and the
+    number of status mismatches, whose hours can't be counted.
+
+    """
+
+    clock_hours = 0
+    mismatches = 0
+    for update in updates_list:
+        if isinstance(update.status_hours, str):
+            mismatches += 1
+        else:
+            clock_hours += update.status_hours
+    mtrf_hours = MTRF_RULES[details.priority]["hours"]
+    return clock_hours, mtrf_hours, clock_hours > mtrf_hours, mismatches
+
+
 def write_single_ticket_CSV(filename, details, updates_list):
     """
     Create a CSV file with details and updates for a single ticket.
@@ -156,22 +1041,44 @@ def write_single_ticket_CSV(filename, details, updates_list):
     with open(filename, mode='w', newline='') as _file:
         _writer = csv.writer(_file, delimiter=',', quotechar='"',
                              quoting=csv.QUOTE_MINIMAL)
-        _writer.writerow(["Ticket No.", details["ticket"]])
-        _writer.writerow(["Site", details["site"]])
-        _writer.writerow(["Priority", details["priority"]])
-        _writer.writerow(["Report Time", details["report time"]])
+        _writer.writerow(["Ticket No.", details.ticket])
+        _writer.writerow(["Site", details.site])
+        _writer.writerow(["Priority", details.priority])
+        _writer.writerow(["Report Time", details.report_time])
         _writer.writerow([])
         _writer.writerow([])
-        _writer.writerow(['Entered By', 'Entered On', 'From Status',
-                          'To Status', 'Status Note', 'Effective Time',
-                          'Status Hours', 'Update Delay'])
+        _writer.writerow(UPDATES_CSV_HEADER[1:])
         for _cell in updates_list:
-            _writer.writerow((_cell["updater"],
-                              _cell["entry time"].strftime(TIME_FORMAT),
-                              _cell["from status"], _cell["to status"],
-                              _cell["status note"],
-                              _cell["effective time"].strftime(TIME_FORMAT),
-                              _cell["status hours"], _cell["update delay"]))
+            _writer.writerow((_cell.updater,
+                              _cell.entry_time.strftime(TIME_FORMAT),
+                              _cell.from_status, _cell.to_status,
+                              _cell.status_note,
+                              _cell.effective_time.strftime(TIME_FORMAT),
+                              _cell.status_hours, _cell.update_delay))
+
+
+def _details_CSV_row(details):
+    """
+    Format the details of a ticket as a row of the details CSV file.
+
+    """
+
+    return (details.ticket, details.site, details.priority,
+            details.report_time.strftime(TIME_FORMAT))
+
+
+def _updates_CSV_row(ticket, update):
+    """
+    Format an update as a row of the updates CSV file.
+
+    """
+
+    return (ticket, update.updater,
+            update.entry_time.strftime(TIME_FORMAT),
+            update.from_status, update.to_status,
+            update.status_note,
+            update.effective_time.strftime(TIME_FORMAT),
+            update.status_hours, update.update_delay)
 
 
 def write_details_CSV(filename, details_list):
@@ -184,223 +1091,745 @@ def write_details_CSV(filename, details_list):
     with open(filename, mode='w', newline='') as _file:
         _writer = csv.writer(_file, delimiter=',', quotechar='"',
                              quoting=csv.QUOTE_MINIMAL)
-        _writer.writerow(['Ticket No.', 'Site', 'Priority', 'Report Date'])
+        _writer.writerow(DETAILS_CSV_HEADER)
         for _cell in details_list:
-            _writer.writerow((_cell["ticket"], _cell["site"], _cell["priority"],
-                              _cell["report time"].strftime(TIME_FORMAT)))
+            _writer.writerow(_details_CSV_row(_cell))
 
 
 def write_updates_CSV(filename, all_updates):
     """
     Create a CSV file with updates from all the tickets in a multi-ticket
-    ZIP file.
+    ZIP file. "all_updates" is an iterable of ticket number and update
+    pairs, since the updates themselves don't record their ticket.
 
     """
 
     with open(filename, mode='w', newline='') as _file:
         _writer = csv.writer(_file, delimiter=',', quotechar='"',
                              quoting=csv.QUOTE_MINIMAL)
-        _writer.writerow(['Ticket No.', 'Entered By', 'Entered On',
-                          'From Status', 'To Status', 'Status Note',
-                          'Effective Time', 'Status Hours', 'Update Delay'])
-        for _cell in all_updates:
-            _writer.writerow((_cell["ticket"], _cell["updater"],
-                              _cell["entry time"].strftime(TIME_FORMAT),
-                              _cell["from status"], _cell["to status"],
-                              _cell["status note"],
-                              _cell["effective time"].strftime(TIME_FORMAT),
-                              _cell["status hours"], _cell["update delay"]))
-
-
-def parse_ticket(word_file):
-
-    # Read the document body and footer into XML Element objects, and
-    # store the document and footer namespace maps.
-    document_root= ET.fromstring(word_file.read("word/document.xml"))
-    doc_ns = document_root.nsmap
-    body = document_root.find("w:body", namespaces = doc_ns)
-    footer= ET.fromstring(word_file.read("word/footer1.xml"))
-    footer_ns = footer.nsmap
-
-    # We need to find the "Details" and "Updates" tables--we'll iterate
-    # through the children of the document body, and use the table titles
-    # to locate the tables we need--each table should be the next child
-    # after the child containing its title.
+        _writer.writerow(UPDATES_CSV_HEADER)
+        for _ticket, _cell in all_updates:
+            _writer.writerow(_updates_CSV_row(_ticket, _cell))
 
-    # Initialize the flags that tell us whether we've found the table
-    # titles.
-    details_found = False
-    updates_found = False
 
-    # Initialize the updates list.
-    updates_list = []
+def _open_output_CSV(filename, checkpoint=None):
+    """
+    Open an output CSV file for writing, through "checkpoint" (see
+    "ArchiveCheckpoint.open_output"), if given. Return the file, and
+    whether it's new (and so needs its header).
 
-    # Compile a regex to detect parenthetical status notes.
-    status_note_patt = re.compile(STATUS_NOTE_PATT_STRING)
+    """
 
-    for child in body:
+    if checkpoint:
+        return checkpoint.open_output(filename)
+    return open(filename, mode='w', newline='',
+                buffering=CSV_BUFFER_SIZE), True
 
 
-        # If the previous child was the "Details" title, pull the values out
-        # of the "Details" table.
+def write_ticket_archive_CSVs(details_filename, updates_filename, tickets,
+                              checkpoint=None):
+    """
+    Create the details and updates CSV files for a multi-ticket ZIP file,
+    writing the rows for each ticket as soon as it's available from
+    "tickets" (an iterable of details and updates pairs), so that only one
+    ticket at a time needs to be held in memory. The files are flushed
+    every "CSV_FLUSH_INTERVAL" tickets, so the output keeps up with the
+    run. With "checkpoint", a resumed run appends to the files.
 
-        if details_found:
+    """
 
-            # Get the ticket number. Just in case the ticket number gets
-            # split over multiple text elements, we join all elements
-            # found into a single string.
-            ticket_query = './/w:tr[descendant::*[text() = "' + TICKET_LABEL + \
-                           '"]]'
-            ticket_row = child.xpath(ticket_query, namespaces = doc_ns)
-            ticket_cells = ticket_row[0].xpath(".//w:tc", namespaces = doc_ns)
-            ticket_para = ticket_cells[1].xpath(".//w:t", namespaces = doc_ns)
-            ticket = "".join([string.text for string in ticket_para])
-
-            # Get the name of the contract--we'll use this to get the site.
-            contract_query = './/w:tr[descendant::*[text() = "' + \
-                             CONTRACT_LABEL + '"]]'
-            contract_row = child.xpath(contract_query, namespaces = doc_ns)
-            contract_cells = contract_row[0].xpath(".//w:tc",
-                                                   namespaces = doc_ns)
-            contract_para = contract_cells[1].xpath(".//w:t",
-                                                    namespaces = doc_ns)
-            contract_string = "".join([string.text for string in contract_para])
-
-            # Pull the site name out of the contract string.
-            site = None
-            for prefix in CONTRACT_PREFIXES:
-                if contract_string.startswith(prefix):
-                    site = contract_string.split(prefix)[-1]
-                    break
-            if not site:
-                raise ValueError("Unknown contract name format")
-
-            # Get the ticket priority.
-            priority_query = './/w:tr[descendant::*[text() = "' + \
-                             PRIORITY_LABEL + '"]]'
-            priority_row = child.xpath(priority_query, namespaces = doc_ns)
-            priority_cells = priority_row[0].xpath(".//w:tc",
-                                                   namespaces = doc_ns)
-            priority_para = priority_cells[1].xpath(".//w:t",
-                                                    namespaces = doc_ns)
-            priority = "".join([string.text for string in priority_para])
-
-            # We'll add one more value to this dict later, when we extract
-            # the report date from the footer.
-            details = {"ticket": ticket, "site": site, "priority": priority}
-
-            # Finally, reset the "details_found" flag to false, so that we
-            # don't try to extract data from subsequent tables.
-            details_found = False
-
-        # Check for the "Details" title. Unless the "Details" title is
-        # found, this will be an empty list, which will evaluate as False
-        # in the Boolean test above.
-        details_found = child.xpath('.//w:t[text()="' + DETAILS_TITLE + '"]',
-                                    namespaces = doc_ns)
+    details_file, new = _open_output_CSV(details_filename, checkpoint)
+    updates_file, _ = _open_output_CSV(updates_filename, checkpoint)
+    with details_file, updates_file:
+        details_writer = csv.writer(details_file, delimiter=',',
+                                    quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        updates_writer = csv.writer(updates_file, delimiter=',',
+                                    quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        if new:
+            details_writer.writerow(DETAILS_CSV_HEADER)
+            updates_writer.writerow(UPDATES_CSV_HEADER)
+
+        for ticket_count, (details, updates_list) in enumerate(tickets, 1):
+            if PROFILE:
+                started = perf_counter()
+
+            # We add the ticket number to each of the updates, as a key to
+            # cross-refernece the two files.
+            details_writer.writerow(_details_CSV_row(details))
+            ticket = details.ticket
+            updates_writer.writerows([_updates_CSV_row(ticket, update)
+                                      for update in updates_list])
+            if ticket_count % CSV_FLUSH_INTERVAL == 0:
+                details_file.flush()
+                updates_file.flush()
+
+            if PROFILE:
+                profile_stage("write CSV", started, per_ticket = False)
+
+
+def _add_to_summaries(summaries, site, priority, breached, clock_hours):
+    """
+    Add a ticket to the running totals for the compliance summaries.
 
-        # If the previous child was the "Updates" title, search the table
-        # for updates, and then break the loop.
+    """
 
-        if updates_found:
+    for summary, key in (("Site", site), ("Priority", priority)):
+        totals = summaries[summary].setdefault(key, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += breached
+        totals[2] += clock_hours
 
-            # Find all of the update cells.
-            updates_query = './/w:tc[descendant::*[contains(text(), "' + \
-                            STATUS_CHANGE_PHRASE + '")]]'
-            updates = child.xpath(updates_query, namespaces = doc_ns)
-
-            for update in updates:
-
-                # Get all the text paragarphs in the update cell.
-                update_paras = update.findall("w:p", namespaces = doc_ns)
-
-                # The status change is always the first paragraph in an
-                # update, and follows a set format. Given that the time
-                # paragraph is sometimes split across multiple text
-                # elements (see below), it's possible the same is true of
-                # the status change paragraph, and so we deal with this
-                # possibility.
-                status_para = update_paras[0].findall(".//w:t",
-                                                      namespaces = doc_ns)
-                status_para_string = "".join([string.text for string
-                                              in status_para])
-
-                # Get the new status.
-                to_status_split = status_para_string.split(TO_SEP)
-                to_status = to_status_split[-1]
-
-                # In some cases, the new status (but not the old one)
-                # includes a parenthetical note. If this is present,
-                # split it out.
-                status_note_split = status_note_patt.split(to_status)
-                if len(status_note_split) > 1:
-                    to_status = status_note_split[0]
-                    status_note = status_note_split[1]
-                else:
-                    status_note = "None"
 
-                # Get the old status, if any.
-                from_status_split = to_status_split[-2].split(FROM_SEP)
-                if len(from_status_split) > 1:
-                    from_status = from_status_split[-1]
-                else:
-                    from_status = "None"
-
-                # Get the updater.
-                updater_split = from_status_split[0].split(UPDATER_SEP)
-                updater = updater_split[0]
-
-                # The time is always the last paragraph in an update
-                # cell. However, this one-line paragraph is sometimes
-                # split across two (or possibly more) text elements.
-                time_para = update_paras[-1].findall(".//w:t",
-                                                     namespaces = doc_ns)
-                time_string = "".join([string.text for string in time_para])
-
-                # Pull out the entry time.  in some cases, this is also
-                # the effective time (in which case the split returns a
-                # single-element list with nothing but the entry time),
-                # while in other cases, the two are listed separately.
-                time_string_split = time_string.split(EFFECTIVE_TIME_SEP)
-                entry_time_string = time_string_split[0]
-                entry_time = datetime.datetime.strptime(entry_time_string,
-                                                        TIME_FORMAT)
-
-                # Pull out the effective time. We pull out the last sub-
-                # (see the above comment) string, and strip a trailing
-                # parenthesis if it's present.
-                eff_time_string = \
-                    time_string_split[-1].rstrip(EFFECTIVE_TIME_STRIP_CHARS)
-                eff_time = datetime.datetime.strptime(eff_time_string,
-                                                      TIME_FORMAT)
-
-                # Add the extracted values to the updates list.
-                d = {"updater": updater, "entry time": entry_time,
-                     "from status": from_status, "to status": to_status,
-                     "status note": status_note, "effective time": eff_time}
-                updates_list.append(d)
-
-            # If we've found and searched the "Updates" table, we're done.
-            break
+def aggregate_compliance(filename, summary_filename, tickets,
+                         checkpoint=None):
+    """
+    Pass the details and updates pairs from "tickets" straight through,
+    while writing a compliance CSV file with one row per ticket (see
+    "ticket_compliance"). Once all the tickets have gone by, summaries per
+    site and per priority are written to a second CSV file,
+    "summary_filename", so that each file is a single table. Only running
+    totals are kept for the summaries, so memory use doesn't grow with the
+    number of tickets or updates.
+
+    With "checkpoint", a resumed run appends to the file, and the rows
+    already there are read back into the totals first, so the summaries
+    still cover every ticket.
 
-        # Check for the "Updates" title. Unless the "Updates" title is
-        # found, this will be an empty list, which will evaluate as False
-        # in the Boolean test above.
-        updates_found = child.xpath('.//w:t[text()="' + UPDATES_TITLE + '"]',
-                                    namespaces = doc_ns)
+    """
 
-    # Reverse the list--in most cases, this should give us the proper
-    # ordering.
-    updates_list.reverse()
+    summaries = {"Site": {}, "Priority": {}}
+    _file, new = _open_output_CSV(filename, checkpoint)
+    if not new:
+        with open(filename, newline='') as previous_file:
+            rows = csv.reader(previous_file)
+            next(rows)
+
+            # The clock hours are only written as an integer when no hours
+            # were counted, and they're read back the same way, so the
+            # totals come out exactly as in an uninterrupted run.
+            for _, site, priority, clock_hours, _, breached, _ in rows:
+                clock_hours = int(clock_hours) if clock_hours.isdigit() \
+                              else float(clock_hours)
+                _add_to_summaries(summaries, site, priority,
+                                  breached == "True", clock_hours)
+    with _file:
+        _writer = csv.writer(_file, delimiter=',', quotechar='"',
+                             quoting=csv.QUOTE_MINIMAL)
+        if new:
+            _writer.writerow(COMPLIANCE_CSV_HEADER)
+        for ticket_count, (details, updates_list) in enumerate(tickets, 1):
+            if PROFILE:
+                started = perf_counter()
+            clock_hours, mtrf_hours, breached, mismatches = \
+                ticket_compliance(details, updates_list)
+            _writer.writerow((details.ticket, details.site, details.priority,
+                              clock_hours, mtrf_hours, breached, mismatches))
+            _add_to_summaries(summaries, details.site, details.priority,
+                              breached, clock_hours)
+            if ticket_count % CSV_FLUSH_INTERVAL == 0:
+                _file.flush()
+            if PROFILE:
+                profile_stage("compliance", started, per_ticket = False)
+
+            yield details, updates_list
+
+    with open(summary_filename, mode='w', newline='') as _file:
+        _writer = csv.writer(_file, delimiter=',', quotechar='"',
+                             quoting=csv.QUOTE_MINIMAL)
+        _writer.writerow(COMPLIANCE_SUMMARY_HEADER)
+        for summary, summary_totals in summaries.items():
+            for key, (count, breaches, clock_hours) in \
+              sorted(summary_totals.items()):
+                _writer.writerow((summary, key, count, breaches,
+                                  breaches / count, clock_hours,
+                                  clock_hours / count))
 
-    # Just in case, sort the list by effective time--notably, this won't
-    # change the ordering of updates with the same effective time (which
-    # will prevent two updates entered in quick succession from being
-    # reversed). If effective times are correct, this should give the
-    # proper ordering almost 100% of the time, with the sole exception
-    # being status changes with the same time that are entered out of
-    # order.
-    updates_list.sort(key = lambda update: update["effective time"])
+
+def write_ticket_archive_arrow(details_filename, updates_filename, tickets,
+                               file_format="parquet"):
+    """
+    A columnar alternative to "write_ticket_archive_CSVs": create Parquet
+    (or, with "file_format" set to "arrow", Arrow IPC stream) files with the
+    details and updates for a multi-ticket ZIP file, with typed columns--
+    times as timestamps, hours as floats, and the repeated strings (sites,
+    priorities, updaters, and statuses) dictionary-encoded. The rows are
+    written as one record batch per "ARROW_BATCH_TICKETS" tickets.
+
+    "Status Hours" is left empty for a status mismatch, which is flagged in
+    the "Status Mismatch" column instead.
+
+    This needs the optional "pyarrow" package.
+
+    """
+
+    import pyarrow as pa
+
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    timestamp = pa.timestamp("s")
+    details_schema = pa.schema([("Ticket No.", pa.string()),
+                                ("Site", dictionary),
+                                ("Priority", dictionary),
+                                ("Report Date", timestamp)])
+    updates_schema = pa.schema([("Ticket No.", pa.string()),
+                                ("Entered By", dictionary),
+                                ("Entered On", timestamp),
+                                ("From Status", dictionary),
+                                ("To Status", dictionary),
+                                ("Status Note", dictionary),
+                                ("Effective Time", timestamp),
+                                ("Status Hours", pa.float64()),
+                                ("Status Mismatch", pa.bool_()),
+                                ("Update Delay", pa.float64())])
+
+    # Each batch has its own dictionaries, which the Arrow IPC file format
+    # doesn't allow, so we use the stream format.
+    if file_format == "arrow":
+        details_writer = pa.ipc.new_stream(details_filename, details_schema)
+        updates_writer = pa.ipc.new_stream(updates_filename, updates_schema)
+    else:
+        import pyarrow.parquet as pq
+        details_writer = pq.ParquetWriter(details_filename, details_schema)
+        updates_writer = pq.ParquetWriter(updates_filename, updates_schema)
+
+    def new_columns(schema):
+        return {name: [] for name in schema.names}
+
+    def write_batch(writer, schema, columns):
+        arrays = []
+        for field in schema:
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(columns[field.name],
+                                       type = field.type.value_type
+                                       ).dictionary_encode())
+            else:
+                arrays.append(pa.array(columns[field.name],
+                                       type = field.type))
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays,
+                                                      schema = schema))
+
+    details_columns = new_columns(details_schema)
+    updates_columns = new_columns(updates_schema)
+    try:
+        for ticket_count, (details, updates_list) in enumerate(tickets, 1):
+            if PROFILE:
+                started = perf_counter()
+
+            for name, value in zip(details_schema.names,
+                                   (details.ticket, details.site,
+                                    details.priority,
+                                    details.report_time)):
+                details_columns[name].append(value)
+            for update in updates_list:
+                status_hours = update.status_hours
+                mismatch = isinstance(status_hours, str)
+                for name, value in zip(updates_schema.names,
+                                       (details.ticket, update.updater,
+                                        update.entry_time,
+                                        update.from_status,
+                                        update.to_status,
+                                        update.status_note,
+                                        update.effective_time,
+                                        None if mismatch else status_hours,
+                                        mismatch, update.update_delay)):
+                    updates_columns[name].append(value)
+
+            if ticket_count % ARROW_BATCH_TICKETS == 0:
+                write_batch(details_writer, details_schema, details_columns)
+                write_batch(updates_writer, updates_schema, updates_columns)
+                details_columns = new_columns(details_schema)
+                updates_columns = new_columns(updates_schema)
+
+            if PROFILE:
+                profile_stage("write " + file_format, started,
+                              per_ticket = False)
+
+        if details_columns["Ticket No."]:
+            write_batch(details_writer, details_schema, details_columns)
+            write_batch(updates_writer, updates_schema, updates_columns)
+    finally:
+        details_writer.close()
+        updates_writer.close()
+
+
+def _find_titles(child):
+    """
+    Check a child of the document body for the "Details" and "Updates"
+    titles, in a single pass over its text elements. Returns a pair of
+    flags: whether each title was found.
+
+    """
+
+    if PROFILE:
+        started = perf_counter()
+    details_found = False
+    updates_found = False
+    for text_element in child.iter(W_T):
+        if text_element.text == DETAILS_TITLE:
+            details_found = True
+        elif text_element.text == UPDATES_TITLE:
+            updates_found = True
+    if PROFILE:
+        profile_stage("xpath", started)
+    return details_found, updates_found
+
+
+def _parse_details_table(child):
+    """
+    Pull the ticket number, site, and priority out of the "Details" table.
+
+    """
+
+    if PROFILE:
+        started = perf_counter()
+
+    # Find the rows holding the ticket number, contract, and priority in a
+    # single pass over the table, keeping the first row found for each
+    # label.
+    labels = (TICKET_LABEL, CONTRACT_LABEL, PRIORITY_LABEL)
+    rows = {}
+    for row in LABELLED_ROWS_QUERY(child, ticket = TICKET_LABEL,
+                                   contract = CONTRACT_LABEL,
+                                   priority = PRIORITY_LABEL):
+        for text in ROW_TEXT_QUERY(row):
+            if text in labels and text not in rows:
+                rows[text] = row
+
+    # Each value is in the second cell of its row. Just in case a value
+    # gets split over multiple text elements, we join all elements found
+    # into a single string.
+    ticket = "".join(ROW_VALUE_QUERY(rows[TICKET_LABEL]))
+    priority = "".join(ROW_VALUE_QUERY(rows[PRIORITY_LABEL]))
+
+    # Get the name of the contract--we'll use this to get the site.
+    contract_string = "".join(ROW_VALUE_QUERY(rows[CONTRACT_LABEL]))
+
+    # Pull the site name out of the contract string.
+    site = None
+    match = CONTRACT_PREFIX_PATT.match(contract_string)
+    if match and match.lastindex:
+        site = contract_string.split(CONTRACT_PREFIXES[match.lastindex - 1]
+                                     )[-1]
+    if not site:
+        raise ValueError("Unknown contract name format")
+
+    if PROFILE:
+        profile_stage("xpath", started)
+
+    # We'll fill in the report time later, when we extract it from the
+    # footer. The site and priority strings repeat across thousands of
+    # tickets, so we intern them to keep a single copy of each.
+    return Details(ticket, sys.intern(site), sys.intern(priority))
+
+
+def _find_update_cells(child):
+    """
+    Return all of the update cells (those that record a status change) in
+    "child".
+
+    """
+
+    if PROFILE:
+        started = perf_counter()
+    update_cells = UPDATE_CELLS_QUERY(child, phrase = STATUS_CHANGE_PHRASE)
+    if PROFILE:
+        profile_stage("xpath", started)
+    return update_cells
+
+
+@lru_cache(maxsize = TIME_CACHE_SIZE)
+def parse_time(time_string):
+    """
+    Convert a time string in "TIME_FORMAT" to a datetime. The same few
+    time strings turn up again and again, so the results are cached.
+
+    """
+
+    # "strptime" is slow, so for the usual form of the usual format (e.g.,
+    # "03/04/21 02:15 PM"), we take the string apart ourselves. Anything
+    # else, including anything "strptime" would reject, goes to
+    # "strptime", which gives the same result for every string that gets
+    # past these checks.
+    if TIME_FORMAT == "%m/%d/%y %I:%M %p" and len(time_string) == 17 and \
+      time_string[2] == "/" and time_string[5] == "/" and \
+      time_string[8] == " " and time_string[11] == ":" and \
+      time_string[14] == " ":
+        digits = time_string[0:2] + time_string[3:5] + time_string[6:8] + \
+                 time_string[9:11] + time_string[12:14]
+        meridiem = time_string[15:].upper()
+        if digits.isascii() and digits.isdigit() and meridiem in ("AM", "PM"):
+            month = int(time_string[0:2])
+            day = int(time_string[3:5])
+            year = int(time_string[6:8])
+            hour = int(time_string[9:11])
+            minute = int(time_string[12:14])
+            if 1 <= month <= 12 and 1 <= day <= 31 and 1 <= hour <= 12 and \
+              minute <= 59:
+                year += 2000 if year <= 68 else 1900
+                hour %= 12
+                if meridiem == "PM":
+                    hour += 12
+                try:
+                    return datetime.datetime(year, month, day, hour, minute)
+                except ValueError: # e.g., February 30
+                    pass
+
+    return datetime.datetime.strptime(time_string, TIME_FORMAT)
+
+
+def _parse_update_cell(update, status_note_patt):
+    """
+    Pull the updater, old and new statuses, status note, and entry and
+    effective times out of a single update cell.
+
+    """
+
+    # Get all the text paragarphs in the update cell.
+    update_paras = list(update.iterchildren(W_P))
+
+    # The status change is always the first paragraph in an update, and
+    # follows a set format. Given that the time paragraph is sometimes
+    # split across multiple text elements (see below), it's possible the
+    # same is true of the status change paragraph, and so we deal with this
+    # possibility.
+    status_para = update_paras[0].iter(W_T)
+    status_para_string = "".join([string.text for string in status_para])
+
+    # Get the new status.
+    to_status_split = status_para_string.split(TO_SEP)
+    to_status = to_status_split[-1]
+
+    # In some cases, the new status (but not the old one) includes a
+    # parenthetical note. If this is present, split it out.
+    status_note_split = status_note_patt.split(to_status)
+    if len(status_note_split) > 1:
+        to_status = status_note_split[0]
+        status_note = status_note_split[1]
+    else:
+        status_note = "None"
+
+    # Get the old status, if any.
+    from_status_split = to_status_split[-2].split(FROM_SEP)
+    if len(from_status_split) > 1:
+        from_status = from_status_split[-1]
+    else:
+        from_status = "None"
+
+    # Get the updater.
+    updater_split = from_status_split[0].split(UPDATER_SEP)
+    updater = updater_split[0]
+
+    # The time is always the last paragraph in an update cell. However,
+    # this one-line paragraph is sometimes split across two (or possibly
+    # more) text elements.
+    time_para = update_paras[-1].iter(W_T)
+    time_string = "".join([string.text for string in time_para])
+
+    # Pull out the entry time.  in some cases, this is also the effective
+    # time (in which case the split returns a single-element list with
+    # nothing but the entry time), while in other cases, the two are listed
+    # separately.
+    time_string_split = time_string.split(EFFECTIVE_TIME_SEP)
+    entry_time_string = time_string_split[0]
+    if PROFILE:
+        started = perf_counter()
+    entry_time = parse_time(entry_time_string)
+
+    # Pull out the effective time. We pull out the last sub- (see the above
+    # comment) string, and strip a trailing parenthesis if it's present.
+    eff_time_string = \
+        time_string_split[-1].rstrip(EFFECTIVE_TIME_STRIP_CHARS)
+    eff_time = parse_time(eff_time_string)
+    if PROFILE:
+        profile_stage("strptime", started)
+
+    # As with the details, the updater, status, and note strings are
+    # mostly repeats, so we intern them.
+    return Update(sys.intern(updater), entry_time, sys.intern(from_status),
+                  sys.intern(to_status), sys.intern(status_note), eff_time)
+
+
+def _discard_element(element):
+    """
+    Free an element we're done with during a streaming parse, along with
+    any earlier siblings that are still hanging around.
+
+    """
+
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def _read_tables(word_file, status_note_patt):
+    """
+    Find the "Details" and "Updates" tables in the document body, and
+    extract the details and the (unsorted) updates.
+
+    We need to find the "Details" and "Updates" tables--we'll iterate
+    through the children of the document body, and use the table titles to
+    locate the tables we need--each table should be the next child after
+    the child containing its title.
+
+    """
+
+    # Read the document body into an XML Element object.
+    if PROFILE:
+        started = perf_counter()
+    document_xml = word_file.read("word/document.xml")
+    if PROFILE:
+        profile_stage("unzip", started)
+        started = perf_counter()
+    document_root = ET.fromstring(document_xml)
+    del document_xml
+    if PROFILE:
+        profile_stage("xml parse", started)
+    body = document_root.find("w:body", namespaces = W_NS)
+
+    # Initialize the flags that tell us whether we've found the table
+    # titles.
+    details_found = False
+    updates_found = False
+
+    # Initialize the updates list.
+    updates_list = []
+
+    for child in body:
+
+        # If the previous child was the "Details" title, pull the values out
+        # of the "Details" table. Then, we reset the "details_found" flag
+        # (below) so that we don't try to extract data from subsequent
+        # tables.
+        if details_found:
+            details = _parse_details_table(child)
+
+        # If the previous child was the "Updates" title, search the table
+        # for updates, and then break the loop--if we've found and searched
+        # the "Updates" table, we're done.
+        if updates_found:
+            for update in _find_update_cells(child):
+                updates_list.append(_parse_update_cell(update,
+                                                       status_note_patt))
+            break
+
+        # Check for the "Details" and "Updates" titles.
+        details_found, updates_found = _find_titles(child)
+
+    return details, updates_list
+
+
+def _stream_tables(word_file, status_note_patt):
+    """
+    A streaming version of "_read_tables": the document body is read
+    straight from the DOCX member with "iterparse", and every element is
+    freed as soon as we're done with it, so that memory use doesn't grow
+    with the size of the document.
+
+    The logic follows "_read_tables", except that the rows of the
+    "Updates" table are searched (and freed) one at a time, as they're
+    read, rather than once the whole table has been read.
+
+    """
+
+    details_found = False
+    updates_found = False
+    in_updates_table = False
+    updates_list = []
+
+    # The depth of the current element: the document root is at depth 1,
+    # the body at 2, the children of the body (titles and tables) at 3, and
+    # table rows at 4.
+    depth = 0
+
+    with word_file.open("word/document.xml") as xml_stream:
+        for event, element in ET.iterparse(xml_stream,
+                                           events = ("start", "end")):
+
+            if event == "start":
+                depth += 1
+                if depth == 3:
+                    in_updates_table = bool(updates_found)
+                continue
+
+            # Search each row of the "Updates" table for updates as soon as
+            # the row is complete.
+            if depth == 4 and in_updates_table:
+                for update in _find_update_cells(element):
+                    updates_list.append(_parse_update_cell(update,
+                                                           status_note_patt))
+                _discard_element(element)
+
+            # The children of the body are handled as in "_read_tables".
+            elif depth == 3:
+                if details_found:
+                    details = _parse_details_table(element)
+                if in_updates_table:
+                    break
+                details_found, updates_found = _find_titles(element)
+                _discard_element(element)
+
+            depth -= 1
+
+    return details, updates_list
+
+
+def _status_mismatches(group, previous_status, next_status):
+    """
+    Count the places where a run of updates doesn't chain: where an
+    update's "from" status isn't the "to" status of the update before it.
+    "previous_status" and "next_status" are the statuses the run has to
+    join up with at either end (or None, if there's nothing there).
+
+    """
+
+    mismatches = 0
+    status = previous_status
+    for update in group:
+        if status is not None and update.from_status != status:
+            mismatches += 1
+        status = update.to_status
+    if next_status is not None and next_status != status:
+        mismatches += 1
+    return mismatches
+
+
+def _chain_tie_group(group, previous_status, next_status):
+    """
+    Reorder a group of updates with the same effective time so that their
+    statuses chain together, starting from "previous_status". Returns the
+    reordered group, or the group as it was if that doesn't reduce the
+    number of status mismatches.
+
+    """
+
+    # Updates are looked up by their "from" status; where there's a choice,
+    # the one listed first wins.
+    by_from_status = {}
+    for update in group:
+        by_from_status.setdefault(update.from_status, deque()).append(update)
+
+    # The first update is the one that carries on from the update before
+    # the group, or, failing that, one that doesn't carry on from any
+    # other update in the group.
+    to_statuses = {update.to_status for update in group}
+    if previous_status in by_from_status:
+        first = by_from_status[previous_status][0]
+    else:
+        first = next((update for update in group
+                      if update.from_status not in to_statuses), group[0])
+
+    chained = []
+    update = first
+    while update is not None:
+        by_from_status[update.from_status].remove(update)
+        chained.append(update)
+        candidates = by_from_status.get(update.to_status)
+        update = candidates[0] if candidates else None
+
+    # Anything that couldn't be chained keeps its place at the end.
+    if len(chained) < len(group):
+        chained_ids = {id(update) for update in chained}
+        chained.extend(update for update in group
+                       if id(update) not in chained_ids)
+
+    if _status_mismatches(chained, previous_status, next_status) < \
+      _status_mismatches(group, previous_status, next_status):
+        return chained
+    return group
+
+
+def order_updates(updates_list):
+    """
+    Put a ticket's updates (as they're listed in the ticket) in order, in
+    place: by effective time and, among updates with the same effective
+    time, so that each update's "from" status matches the "to" status of
+    the update before it, wherever that's possible.
+
+    """
+
+    # The ticket lists the newest update first, so reversing the list
+    # should, in most cases, give us the proper ordering.
+    updates_list.reverse()
+
+    # Just in case, sort the list by effective time--notably, this won't
+    # change the ordering of updates with the same effective time (which
+    # will prevent two updates entered in quick succession from being
+    # reversed). Python's sort finds runs that are already in order (or in
+    # reverse order) by itself, so for the usual cases--the list is already
+    # in order, or in exactly the opposite order--this takes a single pass.
+    effective_time = attrgetter("effective_time")
+    updates_list.sort(key = effective_time)
+
+    # Most tickets have no updates with the same effective time, and for
+    # those, we're done.
+    times = list(map(effective_time, updates_list))
+    if not any(map(eq, times, islice(times, 1, None))):
+        return
+
+    # Sorting by time can't order updates with the same effective time
+    # (e.g., status changes entered in quick succession, or backdated to
+    # the same time), so for those, we follow the statuses instead, to
+    # avoid status mismatches.
+    start = 0
+    while start < len(times):
+        end = start + 1
+        while end < len(times) and times[end] == times[start]:
+            end += 1
+        if end - start > 1:
+            updates_list[start:end] = _chain_tie_group(
+                updates_list[start:end],
+                updates_list[start - 1].to_status if start else None,
+                updates_list[end].from_status
+                if end < len(updates_list) else None)
+        start = end
+
+
+def parse_ticket(word_file, streaming=False):
+    """
+    Extract the details and the list of updates (with the delays between
+    them) from a single ticket. With "streaming", the document body is
+    parsed incrementally rather than read into memory in one piece.
+
+    """
+
+    # Compile a regex to detect parenthetical status notes.
+    status_note_patt = re.compile(STATUS_NOTE_PATT_STRING)
+
+    if streaming:
+        if PROFILE:
+            started = perf_counter()
+            nested_seconds = _current_ticket_seconds()
+        details, updates_list = _stream_tables(word_file, status_note_patt)
+
+        # The XPath and "strptime" stages are recorded on their own while
+        # the document streams, so we leave them out of the parse time.
+        if PROFILE:
+            profile_stage("xml parse", started + _current_ticket_seconds() -
+                                       nested_seconds)
+    else:
+        details, updates_list = _read_tables(word_file, status_note_patt)
+
+    # Read the footer into an XML Element object.
+    if PROFILE:
+        started = perf_counter()
+    footer_xml = word_file.read("word/footer1.xml")
+    if PROFILE:
+        profile_stage("unzip", started)
+        started = perf_counter()
+    footer= ET.fromstring(footer_xml)
+    if PROFILE:
+        profile_stage("xml parse", started)
+
+    priority = details.priority
+    site = details.site
+
+    # Put the updates in order, by effective time and then by status.
+    if PROFILE:
+        started = perf_counter()
+    order_updates(updates_list)
+    if PROFILE:
+        profile_stage("ordering", started)
 
     # Now, we need to calculate delays between updates, and between
     # effective and report times.
@@ -411,7 +1840,7 @@ def parse_ticket(word_file):
         # If this is the first update, the delay between updates is defined
         # as 0.
         if not old_update:
-            update["status hours"] = 0
+            update.status_hours = 0
 
         # Otherwise, calculate the delay--unless the old status indicated
         # the clock was suspended.
@@ -422,24 +1851,24 @@ def parse_ticket(word_file):
         # sort), we record an error code in place of the delay.
         #
         # Since "updates_list" is actually a list of pointers to individual
-        # dicts, we can modify each of those individual dicts ("update") in
-        # turn without causing problems.
+        # "Update" records, we can modify each of those records ("update")
+        # in turn without causing problems.
         else:
-            if update["from status"] != old_update["to status"]:
-                update["status hours"] = "Status mismatch!"
-            elif update["from status"] in SUSPEND_STATUSES:
-                update["status hours"] = 0
+            if update.from_status != old_update.to_status:
+                update.status_hours = "Status mismatch!"
+            elif update.from_status in SUSPEND_STATUSES:
+                update.status_hours = 0
             else:
-                update["status hours"] = \
-                    calculate_delay(old_update["effective time"],
-                                    update["effective time"],
-                                    priority)
+                update.status_hours = \
+                    calculate_delay(old_update.effective_time,
+                                    update.effective_time,
+                                    priority, site)
 
         # Calculate the delay between the entry time and the effective
         # time.
-        update["update delay"] = calculate_delay(update["effective time"],
-                                                 update["entry time"],
-                                                 priority)
+        update.update_delay = calculate_delay(update.effective_time,
+                                                 update.entry_time,
+                                                 priority, site)
 
         # Replace "old_update" with the current update.
         old_update = update
@@ -447,102 +1876,1356 @@ def parse_ticket(word_file):
     # Find the report time in the footers, and add it to the details list.
     # As with the other strings, we account for the possibility of the
     # string being spread across multiple text elements.
-    report_time_query = './/w:p[descendant::*[starts-with(text(), "' + \
-                        REPORT_TIME_PREFIX + '")]]'
-    report_time_para = footer.xpath(report_time_query,
-                                    namespaces = footer_ns)[0]
-    report_time_para_text = report_time_para.findall(".//w:t",
-                                                     namespaces = doc_ns)
+    if PROFILE:
+        started = perf_counter()
+    report_time_para = REPORT_TIME_QUERY(footer,
+                                         prefix = REPORT_TIME_PREFIX)[0]
+    if PROFILE:
+        profile_stage("xpath", started)
+    report_time_para_text = report_time_para.iter(W_T)
     report_time_entry_string = "".join([string.text
                                         for string in report_time_para_text])
     report_time_string = report_time_entry_string.split(REPORT_TIME_PREFIX)[-1]
-    report_time = datetime.datetime.strptime(report_time_string, TIME_FORMAT)
-    details["report time"] = report_time
+    if PROFILE:
+        started = perf_counter()
+    report_time = parse_time(report_time_string)
+    if PROFILE:
+        profile_stage("strptime", started)
+    details.report_time = report_time
 
     return details, updates_list
 
 
-# Get the filename from the command line. This could be either a DOCX file
-# (for a single ticket) or a a ZIP of a DOCX files (for multiple tickets).
-try:
-    filename = argv[1]
-except IndexError:
-    print("ERROR: No input file specified.")
-    stdout.flush()
-    sleep(5)
-    sys.exit()
+def settings_fingerprint():
+    """
+    Return a fingerprint of every setting that can change what
+    "parse_ticket" produces: the labels and separators it looks for, the
+    time format, the contract prefixes, the suspend statuses, the MTRF
+    rules, the duty days, the holiday calendar (and the version of the
+    "holidays" package that provides it), and any closures.
 
-# Read the file--it's going to be in ZIP format either way.
-try:
-    input_file = ZipFile(filename)
-except Exception as e:
-    print("Error opening Word document: " + filename)
-    print(e)
-    stdout.flush()
-    sleep(5)
-    sys.exit()
+    """
 
-# To determine what type of file we're dealing with, we'll use the
-# file extension.
-file_ext = splitext(filename)[-1].lstrip(".").lower()
+    import hashlib
+    import holidays
 
-# A single ticket will be a DOCX file.
-if file_ext == "docx":
+    settings = (DETAILS_TITLE, TICKET_LABEL, CONTRACT_LABEL, PRIORITY_LABEL,
+                UPDATES_TITLE, STATUS_CHANGE_PHRASE, UPDATER_SEP, TO_SEP,
+                STATUS_NOTE_PATT_STRING, FROM_SEP, EFFECTIVE_TIME_SEP,
+                EFFECTIVE_TIME_STRIP_CHARS, REPORT_TIME_PREFIX, TIME_FORMAT,
+                CONTRACT_PREFIXES, sorted(SUSPEND_STATUSES),
+                sorted(MTRF_RULES.items()), DUTY_DAY,
+                sorted(SITE_DUTY_DAYS.items()), HOLIDAY_CALENDAR,
+                holidays.__version__, sorted(_holiday_index["closures"]))
+    return hashlib.sha256(repr(settings).encode("utf-8")).hexdigest()
+
+
+def open_ticket_cache(cache_filename):
+    """
+    Open (creating it, if necessary) the on-disk cache of parsed tickets.
+
+    The cache maps a zipped ticket file, identified by its name, CRC, and
+    size in the ZIP file, to the details and updates "parse_ticket"
+    produced for it, so that tickets that haven't changed since the last
+    run don't need to be decompressed and parsed again. If the cache was
+    written by a different version of the parser, or with different
+    settings (see "settings_fingerprint"), whether they came from the
+    constants at the top of this script, a config file, or closures, it's
+    cleared.
+
+    """
+
+    # With "--pipeline", tickets are looked up from the reader thread; the
+    # pipeline makes sure only one thread uses the cache at a time.
+    import sqlite3
+    cache = sqlite3.connect(cache_filename, check_same_thread = False)
+    if cache.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+        cache.execute("DROP TABLE IF EXISTS tickets")
+        cache.execute("DROP TABLE IF EXISTS settings")
+        cache.execute("PRAGMA user_version = " + str(CACHE_VERSION))
+    cache.execute("CREATE TABLE IF NOT EXISTS tickets ("
+                  "name TEXT, crc INTEGER, file_size INTEGER, "
+                  "result BLOB, size INTEGER, last_used REAL, "
+                  "PRIMARY KEY (name, crc, file_size))")
+    cache.execute("CREATE TABLE IF NOT EXISTS settings (fingerprint TEXT)")
+
+    fingerprint = settings_fingerprint()
+    cached_settings = cache.execute("SELECT fingerprint FROM settings"
+                                    ).fetchone()
+    if cached_settings != (fingerprint,):
+        cache.execute("DELETE FROM tickets")
+        cache.execute("DELETE FROM settings")
+        cache.execute("INSERT INTO settings VALUES (?)", (fingerprint,))
+    return cache
+
+
+def cache_lookup(cache, zipped_file):
+    """
+    Return the cached details and updates for a zipped ticket file, or None
+    if the ticket isn't in the cache.
+
+    """
+
+    if PROFILE:
+        started = perf_counter()
+    key = (zipped_file.filename, zipped_file.CRC, zipped_file.file_size)
+    row = cache.execute("SELECT result FROM tickets WHERE name = ? AND "
+                        "crc = ? AND file_size = ?", key).fetchone()
+    if row is None:
+        result = None
+    else:
+        cache.execute("UPDATE tickets SET last_used = ? WHERE name = ? AND "
+                      "crc = ? AND file_size = ?", (time(),) + key)
+        import pickle
+        result = pickle.loads(row[0])
+    if PROFILE:
+        profile_stage("cache", started)
+    return result
+
+
+def cache_store(cache, zipped_file, result):
+    """
+    Add the details and updates for a zipped ticket file to the cache.
+
+    """
+
+    if PROFILE:
+        started = perf_counter()
+    import pickle
+    blob = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    cache.execute("INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?, ?, ?)",
+                  (zipped_file.filename, zipped_file.CRC,
+                   zipped_file.file_size, blob, len(blob), time()))
+    if PROFILE:
+        profile_stage("cache", started)
+
+
+def close_ticket_cache(cache, max_size=CACHE_MAX_SIZE):
+    """
+    Evict the least recently used tickets until the cache is no larger than
+    "max_size" bytes, then save and close it.
+
+    """
+
+    total_size = cache.execute("SELECT COALESCE(SUM(size), 0) FROM tickets"
+                               ).fetchone()[0]
+    evicted = []
+    if total_size > max_size:
+        rows = cache.execute("SELECT rowid, size FROM tickets "
+                             "ORDER BY last_used").fetchall()
+        for rowid, size in rows:
+            if total_size <= max_size:
+                break
+            evicted.append((rowid,))
+            total_size -= size
+        cache.executemany("DELETE FROM tickets WHERE rowid = ?", evicted)
+    cache.commit()
+
+    # Deleted rows only shrink the file once it's vacuumed.
+    if evicted:
+        cache.execute("VACUUM")
+    cache.close()
+
+
+class MemberView:
+    """
+    A read-only file over part of a memory-mapped ZIP file: a DOCX file
+    stored (uncompressed) in a multi-ticket ZIP file. Opening it as a
+    "ZipFile" reads only the parts of the DOCX file that are needed, with
+    no copy of the whole DOCX file.
+
+    """
+
+    def __init__(self, archive_map, start, size):
+        self._archive_map = archive_map
+        self._start = start
+        self._view = memoryview(archive_map)[start:start + size]
+        self._position = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            end = len(self._view)
+        else:
+            end = min(self._position + size, len(self._view))
+        data = self._view[self._position:end].tobytes()
+        self._position = max(self._position, end)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def seekable(self):
+        return True
+
+    def release(self):
+        """
+        Release the view, and tell the OS we're done with the pages of the
+        map it covered (they're still cached, but no longer count towards
+        this process's memory).
+
+        """
+
+        size = len(self._view)
+        self._view.release()
+        import mmap
+        if hasattr(self._archive_map, "madvise") and \
+          hasattr(mmap, "MADV_DONTNEED"):
+            first_page = -(-self._start // mmap.PAGESIZE) * mmap.PAGESIZE
+            last_page = (self._start + size) // mmap.PAGESIZE * mmap.PAGESIZE
+            if last_page > first_page:
+                self._archive_map.madvise(mmap.MADV_DONTNEED, first_page,
+                                          last_page - first_page)
+
+
+def map_archive(input_file):
+    """
+    Memory-map the file behind a multi-ticket "ZipFile", for
+    "_read_zipped_file". Returns None if it can't be mapped (e.g., it isn't
+    an ordinary file, or it's empty).
+
+    """
+
+    import mmap
+    try:
+        return mmap.mmap(input_file.fp.fileno(), 0, access = mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def parse_zipped_ticket(member, streaming=False):
+    """
+    Parse a single ticket from a DOCX file stored in a multi-ticket ZIP
+    file: either its raw bytes, or a "MemberView". This is a module-level
+    function so that it can be sent to the worker processes in parallel
+    mode.
+
+    """
+
+    if isinstance(member, MemberView):
+        try:
+            return parse_ticket(ZipFile(member), streaming)
+        finally:
+            member.release()
+    return parse_ticket(ZipFile(BytesIO(member)), streaming)
+
+
+def _parse_zipped_ticket_safely(member_bytes, streaming=False,
+                                profile=False):
+    """
+    Wrap "parse_zipped_ticket" for use in a worker process, returning the
+    error message instead of raising, so that one bad ticket doesn't kill
+    the other tickets in the batch. With "profile", the time taken by the
+    ticket and its stages are returned too, for the main process to add to
+    its profile.
+
+    """
+
+    if profile:
+        start_profiling()
+        started = perf_counter()
+    try:
+        result = parse_zipped_ticket(member_bytes, streaming)
+        error = None
+    except Exception as e:
+        result = None
+        error = repr(e)
+    if profile:
+        return result, error, (perf_counter() - started,
+                               take_ticket_profile()[1])
+    return result, error, None
+
+
+def _read_zipped_file(input_file, zipped_file, archive_map=None):
+    """
+    Read (and decompress) a ticket file from a multi-ticket ZIP file. If
+    the ZIP file has been memory-mapped (see "map_archive"), and the ticket
+    file is stored rather than compressed, a "MemberView" of the ticket
+    file is returned instead of a copy of it.
+
+    """
+
+    if PROFILE:
+        started = perf_counter()
+
+    # The ticket file's data follows its local header, which we have to
+    # read for the length of its name and extra fields (these can differ
+    # from the ones in the central directory). Encrypted files, and
+    # anything unexpected, are left to "ZipFile".
+    #
+    # Unlike "ZipFile.read", we don't check the CRC of the whole ticket
+    # file, since that would mean reading all of it, including any images
+    # and attachments we never use; the parts we do read are still checked
+    # against their own CRCs when they're decompressed.
+    member = None
+    if archive_map is not None and \
+      zipped_file.compress_type == ZIP_STORED and \
+      not zipped_file.flag_bits & 0x1:
+        import struct
+        header_offset = zipped_file.header_offset
+        if archive_map[header_offset:header_offset + 4] == b"PK\x03\x04":
+            name_length, extra_length = \
+                struct.unpack_from("<HH", archive_map, header_offset + 26)
+            start = header_offset + 30 + name_length + extra_length
+            if start + zipped_file.file_size <= len(archive_map):
+                member = MemberView(archive_map, start, zipped_file.file_size)
+    if member is None:
+        member = input_file.read(zipped_file.filename)
+
+    if PROFILE:
+        profile_stage("unzip", started)
+    return member
+
+
+def _zipped_ticket_files(input_file, skip=frozenset()):
+    """
+    Return the "ZipInfo" objects for the ticket files in a multi-ticket ZIP
+    file, leaving out any whose names are in "skip".
+
+    """
+
+    # The "if" skips over directories (The list of directories and files in
+    # a "ZipFile" object is flat, not hierarchical.)
+    return [zipped_file for zipped_file in input_file.filelist
+            if splitext(zipped_file.filename)[-1].lstrip('.').lower()
+            == "docx" and zipped_file.filename not in skip]
+
+
+def _report_ticket_error(rejects, filename, error):
+    """
+    Pass a ticket file that failed to parse, and the error, to "rejects",
+    if given; otherwise, just report the error.
+
+    """
+
+    if rejects:
+        rejects(filename, error)
+    else:
+        print("Error parsing ticket file: " + filename)
+        print(error)
+        stdout.flush()
+
+
+def iter_zipped_tickets(input_file, workers=1, streaming=False, cache=None,
+                        archive_map=None, skip=frozenset(), rejects=None):
+    """
+    Yield the member name, details, and updates of each ticket in a multi-
+    ticket ZIP file, in archive order, leaving out the members named in
+    "skip".
+
+    With a single worker, the tickets are parsed one after another in this
+    process. With more than one worker, the raw DOCX bytes are sent to a
+    process pool. A ticket that can't be read or parsed is passed, with
+    the error, to "rejects" (if given) and skipped; with a single worker and no
+    "rejects", the error is raised as usual, and otherwise it's reported.
+    Either way, tickets found in "cache" (if given) aren't read or parsed
+    at all, and newly parsed tickets are added to it. With a single worker,
+    stored ticket files are read straight out of "archive_map" (see
+    "map_archive"), if it's given.
+
+    """
+
+    zipped_files = _zipped_ticket_files(input_file, skip)
+
+    if workers <= 1:
+        for zipped_file in zipped_files:
+            if PROFILE:
+                started = perf_counter()
+            result = cache_lookup(cache, zipped_file) if cache else None
+            error = None
+            if result is None:
+                try:
+                    result = parse_zipped_ticket(
+                        _read_zipped_file(input_file, zipped_file,
+                                          archive_map),
+                        streaming)
+                except Exception as e:
+                    if not rejects:
+                        raise
+                    error = repr(e)
+                if cache and not error:
+                    cache_store(cache, zipped_file, result)
+            if PROFILE:
+                finish_ticket_profile(zipped_file.filename,
+                                      perf_counter() - started)
+            if error:
+                _report_ticket_error(rejects, zipped_file.filename, error)
+                continue
+            details, updates_list = result
+            yield zipped_file.filename, details, updates_list
+        return
+
+    # We keep a bounded window of pending tickets, so that we never hold
+    # more than a few raw DOCX files per worker in memory. The futures are
+    # collected in submission order, which keeps the output in archive
+    # order regardless of which worker finishes first. Cached tickets go
+    # through the same window (with no future), to keep their place in the
+    # order.
+    # The worker processes don't necessarily share this process's memory,
+    # so they're given any closures and config we've loaded.
+    from concurrent.futures import ProcessPoolExecutor
+    max_pending = workers * 4
+    closures = [datetime.date.fromordinal(ordinal)
+                for ordinal in _holiday_index["closures"]]
+    with ProcessPoolExecutor(max_workers = workers,
+                             initializer = _init_worker,
+                             initargs = (closures, _loaded_config["config"])
+                             ) as executor:
+        pending = deque()
+        remaining = iter(zipped_files)
+        while True:
+            while len(pending) < max_pending:
+                zipped_file = next(remaining, None)
+                if zipped_file is None:
+                    break
+                result = cache_lookup(cache, zipped_file) if cache else None
+                if result is not None:
+                    pending.append((zipped_file, None, result, None))
+                    continue
+
+                # A ticket file that can't be read (e.g., one that fails its
+                # CRC check) goes through the window too, so that its error
+                # is reported in archive order.
+                try:
+                    member_bytes = _read_zipped_file(input_file, zipped_file)
+                except Exception as e:
+                    pending.append((zipped_file, None, None, repr(e)))
+                    continue
+                future = executor.submit(_parse_zipped_ticket_safely,
+                                         member_bytes, streaming,
+                                         PROFILE is not None)
+                pending.append((zipped_file, future, None, None))
+            if not pending:
+                break
+            zipped_file, future, result, error = pending.popleft()
+            if error:
+                _report_ticket_error(rejects, zipped_file.filename, error)
+                continue
+            if future:
+                result, error, ticket_profile = future.result()
+                if ticket_profile:
+                    finish_ticket_profile(zipped_file.filename,
+                                          *ticket_profile)
+                if error:
+                    _report_ticket_error(rejects, zipped_file.filename,
+                                         error)
+                    continue
+                if cache:
+                    cache_store(cache, zipped_file, result)
+            details, updates_list = result
+            yield zipped_file.filename, details, updates_list
+
+
+class PipelineAborted(Exception):
+    """
+    Raised in a pipeline stage when the run has been stopped, e.g., because
+    writing the output failed.
+
+    """
+
+
+class PipelineQueue:
+    """
+    A bounded queue between two stages of the pipeline (see
+    "iter_pipelined_tickets"), which records how full it gets and how long
+    the stages on either side of it wait on it.
+
+    """
+
+    def __init__(self, name, size, abort):
+        from queue import Queue
+        self.name = name
+        self.size = size
+        self._queue = Queue(maxsize = size)
+        self._abort = abort
+        self.items = 0
+        self.total_depth = 0
+        self.max_depth = 0
+        self.producer_waits = 0.0
+        self.consumer_waits = 0.0
+
+    def put(self, item):
+        from queue import Full
+        started = perf_counter()
+        while True:
+            try:
+                self._queue.put(item, timeout = PIPELINE_POLL_INTERVAL)
+                break
+            except Full:
+                if self._abort.is_set():
+                    raise PipelineAborted()
+        self.producer_waits += perf_counter() - started
+
+        # The "None" that marks the end of the tickets isn't counted.
+        if item is not None:
+            depth = self._queue.qsize()
+            self.items += 1
+            self.total_depth += depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def get(self):
+        from queue import Empty
+        started = perf_counter()
+        while True:
+            try:
+                item = self._queue.get(timeout = PIPELINE_POLL_INTERVAL)
+                break
+            except Empty:
+                if self._abort.is_set():
+                    raise PipelineAborted()
+        self.consumer_waits += perf_counter() - started
+        return item
+
+    def stats(self):
+        return {"name": self.name, "size": self.size, "items": self.items,
+                "mean depth": self.total_depth / self.items
+                              if self.items else 0.0,
+                "max depth": self.max_depth,
+                "producer waits": self.producer_waits,
+                "consumer waits": self.consumer_waits}
+
+
+def _pipeline_read(input_file, zipped_files, cache, cache_lock, read_queue,
+                   failures, archive_map=None):
+    """
+    The reader stage of the pipeline: look each ticket file up in the
+    cache, and read (and decompress) the ones that aren't there. A ticket
+    file that can't be read is passed on with the error, to be reported
+    and skipped. With profiling on, the stages recorded for each ticket
+    are passed on with it.
+
+    """
+
+    try:
+        for zipped_file in zipped_files:
+            result = None
+            member_bytes = None
+            error = None
+            if cache:
+                with cache_lock:
+                    result = cache_lookup(cache, zipped_file)
+            if result is None:
+                try:
+                    member_bytes = _read_zipped_file(input_file, zipped_file,
+                                                     archive_map)
+                except Exception as e:
+                    error = repr(e)
+            read_queue.put((zipped_file, member_bytes, result, error,
+                            take_ticket_profile() if PROFILE else None))
+        read_queue.put(None)
+    except PipelineAborted:
+        pass
+    except Exception as e:
+        failures.append(e)
+        try:
+            read_queue.put(None)
+        except PipelineAborted:
+            pass
+
+
+def _pipeline_parse(read_queue, parsed_queue, executor, workers, streaming,
+                    failures):
+    """
+    The parser stage of the pipeline: parse each ticket file, either in
+    this thread or, with an executor, in a bounded window of tickets sent
+    to the worker processes. A ticket that couldn't be read, or fails to
+    parse, is passed on with the error, to be reported and skipped. With
+    profiling on, the stages recorded while parsing each ticket are added
+    to those from the reader stage, and passed on with it.
+
+    """
+
+    try:
+        pending = deque()
+        finished = False
+        while True:
+
+            # Without worker processes, there's never more than one ticket
+            # in the window.
+            while not finished and (len(pending) < workers * 4 if executor
+                                    else not pending):
+                item = read_queue.get()
+                if item is None:
+                    finished = True
+                    break
+                zipped_file, member_bytes, result, error, ticket_profile = item
+                if result is not None or error:
+                    work = None
+                elif executor:
+                    work = executor.submit(_parse_zipped_ticket_safely,
+                                           member_bytes, streaming,
+                                           PROFILE is not None)
+                else:
+                    work = member_bytes
+                pending.append((zipped_file, work, result, error,
+                                ticket_profile))
+            if not pending:
+                break
+
+            zipped_file, work, result, error, ticket_profile = \
+                pending.popleft()
+            parsed = work is not None
+            if parsed and executor:
+                result, error, parse_profile = work.result()
+            elif parsed:
+                started = perf_counter()
+                try:
+                    result = parse_zipped_ticket(work, streaming)
+                except Exception as e:
+                    error = repr(e)
+
+                # The stages are recorded in this thread's own current
+                # ticket, so only this ticket's are included.
+                if PROFILE:
+                    parse_profile = (perf_counter() - started,
+                                     take_ticket_profile()[1])
+            if parsed and ticket_profile:
+                ticket_profile = combine_ticket_profiles(ticket_profile,
+                                                         parse_profile)
+            parsed_queue.put((zipped_file, result, error, ticket_profile,
+                              parsed))
+        parsed_queue.put(None)
+    except PipelineAborted:
+        pass
+    except Exception as e:
+        failures.append(e)
+        try:
+            parsed_queue.put(None)
+        except PipelineAborted:
+            pass
+
+
+def iter_pipelined_tickets(input_file, workers=1, streaming=False,
+                           cache=None, archive_map=None, skip=frozenset(),
+                           rejects=None):
+    """
+    Like "iter_zipped_tickets", but with the reading and parsing of the
+    tickets done in separate threads, so that reading, parsing, and writing
+    the output (by whatever consumes this generator) all overlap. The
+    stages are connected by bounded queues, so that a slow stage holds up
+    the ones before it instead of letting tickets pile up in memory.
+
+    The parser stage uses worker processes if "workers" is more than one;
+    otherwise, stored ticket files are read straight out of "archive_map",
+    if it's given. Either way, a ticket that fails to parse is passed to
+    "rejects" (if given) or reported, and skipped, and the members named
+    in "skip" are left out. With profiling on, the queue statistics are
+    added to the profile.
+
+    """
+
+    from threading import Event, Lock, Thread
+
+    abort = Event()
+    cache_lock = Lock()
+    failures = []
+    read_queue = PipelineQueue("read", PIPELINE_QUEUE_SIZE, abort)
+    parsed_queue = PipelineQueue("parsed", PIPELINE_QUEUE_SIZE, abort)
+
+    # The worker processes are all started here, before the other threads
+    # are, since forking a process while other threads are running can
+    # leave locks held in the new process. (Where the processes are
+    # forked, they're all started at the first submission.)
+    executor = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        closures = [datetime.date.fromordinal(ordinal)
+                    for ordinal in _holiday_index["closures"]]
+        executor = ProcessPoolExecutor(max_workers = workers,
+                                       initializer = _init_worker,
+                                       initargs = (closures,
+                                                   _loaded_config["config"]))
+        executor.submit(int).result()
+
+    stages = [Thread(target = _pipeline_read,
+                     args = (input_file,
+                             _zipped_ticket_files(input_file, skip),
+                             cache, cache_lock, read_queue, failures,
+                             None if executor else archive_map),
+                     daemon = True),
+              Thread(target = _pipeline_parse,
+                     args = (read_queue, parsed_queue, executor, workers,
+                             streaming, failures),
+                     daemon = True)]
+    for stage in stages:
+        stage.start()
+
+    try:
+        while True:
+            item = parsed_queue.get()
+            if item is None:
+                break
+            zipped_file, result, error, ticket_profile, parsed = item
+            if ticket_profile:
+                finish_ticket_profile(zipped_file.filename, *ticket_profile)
+            if error:
+                _report_ticket_error(rejects, zipped_file.filename, error)
+                continue
+            if cache and parsed:
+                with cache_lock:
+                    cache_store(cache, zipped_file, result)
+            details, updates_list = result
+            yield zipped_file.filename, details, updates_list
+        if failures:
+            raise failures[0]
+
+    # However we got here, the other stages are stopped before we return
+    # (or raise).
+    finally:
+        abort.set()
+        for stage in stages:
+            stage.join()
+        if executor:
+            executor.shutdown(cancel_futures = True)
+        if PROFILE:
+            PROFILE["pipeline"] = [read_queue.stats(), parsed_queue.stats()]
+
+
+def output_filename(filename, suffix):
+    """
+    Return the name of an output file for the input file "filename": the
+    input file's name, without its extension (whatever its case), plus
+    "suffix". A name that would overwrite the input file is refused.
+
+    """
+
+    output = splitext(filename)[0] + suffix
+    if normcase(abspath(output)) == normcase(abspath(filename)):
+        raise ValueError("Output file would overwrite the input file: " +
+                         filename)
+    return output
+
+
+def process_single_ticket(filename, input_file, streaming=False):
+    """
+    Write the CSV file for a single-ticket DOCX file.
+
+    """
 
     # Get the updates data and details from the ticket.
-    details, updates_list = parse_ticket(input_file)
+    if PROFILE:
+        started = perf_counter()
+    details, updates_list = parse_ticket(input_file, streaming)
+    if PROFILE:
+        finish_ticket_profile(filename, perf_counter() - started)
 
     # Add a line to "updates_list" that shows the delay between the
     # completion time and the report time.
-    report_time = details["report time"]
-    report_delay = calculate_delay(updates_list[-1]["effective time"],
-                                   report_time, details["priority"])
-    report_time_update = {"updater": "", "entry time": report_time,
-                          "from status": updates_list[-1]["to status"],
-                          "to status": "Report Date", "status note": "None",
-                          "effective time": report_time,
-                          "status hours": report_delay, "update delay": ""}
+    report_time = details.report_time
+    report_delay = calculate_delay(updates_list[-1].effective_time,
+                                   report_time, details.priority,
+                                   details.site)
+    report_time_update = Update("", report_time, updates_list[-1].to_status,
+                                "Report Date", "None", report_time,
+                                report_delay, "")
     updates_list.append(report_time_update)
 
     # Write the output CSV.
-    report_filename = filename.replace('docx','csv')
+    report_filename = output_filename(filename, '.csv')
+    if PROFILE:
+        started = perf_counter()
     write_single_ticket_CSV(report_filename, details, updates_list)
+    if PROFILE:
+        profile_stage("write CSV", started)
+
+
+class ArchiveCheckpoint:
+    """
+    Checkpoints for a multi-ticket ZIP run, so that a run that stops
+    partway through (a crash, or Ctrl-C) can be resumed without redoing
+    the tickets whose output has already been written.
+
+    Every "CHECKPOINT_INTERVAL" tickets, the output files are flushed, and
+    a line is added to the journal ("<name>_journal.jsonl"), with the
+    names of the ticket files finished since the last checkpoint and the
+    size of each output file. Resuming a run skips the ticket files in the
+    journal, and cuts each output file back to its size at the last
+    checkpoint before appending to it, so that rows written after the
+    checkpoint aren't written twice. The journal is deleted once the run
+    has finished.
+
+    Ticket files that fail to parse are written, with the error, to a
+    rejects CSV file ("<name>_rejects.csv"), rather than stopping the run,
+    and count as finished. The rejects file is deleted at the end if it's
+    empty.
+
+    With "journal" False (for the columnar formats, which can't be
+    appended to), there are no checkpoints, only the rejects file.
+
+    """
+
+    def __init__(self, filename, resume=False, journal=True):
+        self.journal_filename = output_filename(filename, JOURNAL_FILE_SUFFIX)
+        self.rejects_filename = output_filename(filename, REJECTS_FILE_SUFFIX)
+        self.completed = frozenset()
+        self.offsets = {}
+        if journal and resume and exists(self.journal_filename):
+            self._read_journal()
+        self.pending = []
+        self.files = []
+        self.rejected = 0
+
+        # The journal is started again with everything from the last run,
+        # which also drops a line left half-written by a crash.
+        self.journal = None
+        if journal:
+            self.journal = open(self.journal_filename, mode='w')
+            if self.offsets:
+                self._write_journal(sorted(self.completed), self.offsets)
+
+        self.rejects_file, new = self.open_output(self.rejects_filename)
+        self.rejects_writer = csv.writer(self.rejects_file, delimiter=',',
+                                         quotechar='"',
+                                         quoting=csv.QUOTE_MINIMAL)
+        if new:
+            self.rejects_writer.writerow(REJECTS_CSV_HEADER)
+
+    def _read_journal(self):
+        """
+        Read the ticket files finished, and the output file sizes at the
+        last checkpoint, from the journal of an earlier run.
+
+        """
+
+        import json
+
+        completed = set()
+        with open(self.journal_filename) as journal:
+            for line in journal:
+                try:
+                    checkpoint = json.loads(line)
+                except ValueError:
+                    break
+                completed.update(checkpoint["done"])
+                self.offsets = checkpoint["offsets"]
+        self.completed = frozenset(completed)
+
+    def _write_journal(self, done, offsets):
+        """
+        Add a checkpoint to the journal.
+
+        """
 
-# A collection of tickets will be a ZIP file containing a directory with a
-# single DOCX file for each ticket.
-elif file_ext == "zip":
+        import json
 
-    # Initialize lists of details and updates.
-    details_list = []
-    all_updates = []
+        self.journal.write(json.dumps({"done": done, "offsets": offsets}) +
+                           "\n")
+        self.journal.flush()
+
+    def open_output(self, filename):
+        """
+        Open an output file for writing, and include it in the checkpoints.
+        When resuming, a file that was in the last checkpoint is cut back
+        to its size then, and appended to. Return the file, and whether
+        it's new (and so needs its header).
+
+        """
+
+        key = basename(filename)
+        if key in self.offsets and exists(filename):
+            _file = open(filename, mode='a', newline='',
+                         buffering=CSV_BUFFER_SIZE)
+            _file.truncate(self.offsets[key])
+            new = False
+        else:
+            _file = open(filename, mode='w', newline='',
+                         buffering=CSV_BUFFER_SIZE)
+            new = True
+        self.files.append((key, _file))
+        return _file, new
+
+    def save(self):
+        """
+        Flush the output files, and add a checkpoint to the journal.
+
+        """
+
+        if self.journal is None:
+            return
+        offsets = {}
+        for key, _file in self.files:
+            if not _file.closed:
+                _file.flush()
+                offsets[key] = fstat(_file.fileno()).st_size
+        self._write_journal(self.pending, offsets)
+        self.pending = []
+
+    def done(self, member_name):
+        """
+        Note that a ticket file is finished, and save a checkpoint every
+        "CHECKPOINT_INTERVAL" tickets.
+
+        """
+
+        self.pending.append(member_name)
+        if len(self.pending) >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def reject(self, member_name, error):
+        """
+        Report a ticket file that failed to parse, and add it to the
+        rejects file.
+
+        """
+
+        print("Error parsing ticket file: " + member_name)
+        print(error)
+        stdout.flush()
+        self.rejects_writer.writerow((member_name, error))
+        self.rejected += 1
+        self.done(member_name)
+
+    def tickets(self, zipped_tickets):
+        """
+        Pass the details and updates of each ticket from "zipped_tickets"
+        (as yielded by "iter_zipped_tickets") on to the writers. A ticket
+        is only noted as finished when the next one is asked for, since by
+        then its rows have been written to every output file.
+
+        """
+
+        for member_name, details, updates_list in zipped_tickets:
+            yield details, updates_list
+            self.done(member_name)
+        self.save()
+
+    def finish(self):
+        """
+        Close the journal and the rejects file, once the run has finished,
+        and delete them if they're no longer needed.
+
+        """
+
+        self.rejects_file.close()
+        if self.journal is not None:
+            self.journal.close()
+            remove(self.journal_filename)
+        with open(self.rejects_filename, newline='') as rejects_file:
+            rejected = sum(1 for _ in csv.reader(rejects_file)) - 1
+        if rejected:
+            print(str(rejected) + " ticket file(s) couldn't be parsed; see " +
+                  self.rejects_filename)
+        else:
+            remove(self.rejects_filename)
+
+
+def process_ticket_archive(filename, input_file, workers=1, streaming=False,
+                           use_cache=True, output_format="csv",
+                           pipeline=False, resume=False, use_map=True):
+    """
+    Write the details and updates CSV (or, depending on "output_format",
+    Parquet or Arrow) files for a multi-ticket ZIP file. Unless
+    "use_cache" is False, parsed tickets are cached in a file next to the
+    output files. With "pipeline", the tickets are read and parsed in
+    separate threads (see "iter_pipelined_tickets"). With "resume", a CSV
+    run that was interrupted carries on from its last checkpoint (see
+    "ArchiveCheckpoint"). With "use_map" False, the ZIP file is never
+    memory-mapped.
+
+    """
+
+    checkpoint = ArchiveCheckpoint(filename, resume, output_format == "csv")
+    if checkpoint.completed:
+        print("Resuming: " + str(len(checkpoint.completed)) +
+              " ticket file(s) already done.")
+
+    if use_cache:
+        cache = open_ticket_cache(output_filename(filename,
+                                                  CACHE_FILE_SUFFIX))
+    else:
+        cache = None
+
+    # The worker processes need copies of the ticket files anyway, but
+    # otherwise, we map the ZIP file into memory, so that stored ticket
+    # files can be parsed without being copied first. If a mapped file is
+    # cut short or replaced while it's being read, though, the process is
+    # killed (by SIGBUS) rather than getting an exception, so where that
+    # mustn't happen (e.g., in watch mode), "use_map" is False.
+    archive_map = map_archive(input_file) if workers <= 1 and use_map \
+                  else None
 
     # Iterate through the individual ticket files, getting the details and
-    # updates for each; we add the ticket number to each of the updates, as
-    # a key to cross-refernece the two lists.
-    #
-    # The "if" skips over directories (The list of directories and files in
-    # a "ZipFile" object is flat, not hierarchical.)
-    for zipped_file in input_file.filelist:
-        zipped_file_name = zipped_file.filename
-        if splitext(zipped_file_name)[-1].lstrip('.').lower() == "docx":
-            word_file = ZipFile(BytesIO(input_file.read(zipped_file_name)))
-            details, updates_list = parse_ticket(word_file)
-            details_list.append(details)
-            ticket = details["ticket"]
-            for update in updates_list:
-                update["ticket"] = ticket
-            all_updates.extend(updates_list)
+    # updates for each, and write them to the details and updates files as
+    # we go.
+    if pipeline:
+        zipped_tickets = iter_pipelined_tickets(input_file, workers,
+                                                streaming, cache, archive_map,
+                                                checkpoint.completed,
+                                                checkpoint.reject)
+    else:
+        zipped_tickets = iter_zipped_tickets(input_file, workers, streaming,
+                                             cache, archive_map,
+                                             checkpoint.completed,
+                                             checkpoint.reject)
+    tickets = checkpoint.tickets(zipped_tickets)
+
+    # The compliance CSV file is written as the tickets go by on their way
+    # to the writers, and its summary once they've all gone by.
+    compliance_filename = output_filename(filename, '_compliance.csv')
+    summary_filename = output_filename(filename, '_compliance_summary.csv')
+    tickets = aggregate_compliance(compliance_filename, summary_filename,
+                                   tickets, checkpoint)
+
+    extension = OUTPUT_EXTENSIONS[output_format]
+    details_filename = output_filename(filename, '_details' + extension)
+    updates_filename = output_filename(filename, '_updates' + extension)
+    if output_format == "csv":
+        write_ticket_archive_CSVs(details_filename, updates_filename, tickets,
+                                  checkpoint)
+    else:
+        write_ticket_archive_arrow(details_filename, updates_filename,
+                                   tickets, output_format)
+    checkpoint.finish()
+
+    if cache:
+        close_ticket_cache(cache)
+    if archive_map is not None:
+        archive_map.close()
+
+
+def process_input_file(filename, input_file, arguments, workers=1):
+    """
+    Process a single DOCX or ZIP file that has already been opened, with
+    the options from the command line.
+
+    """
+
+    # To determine what type of file we're dealing with, we'll use the
+    # file extension.
+    file_ext = splitext(filename)[-1].lstrip(".").lower()
+
+    if arguments.profile:
+        start_profiling()
+    if arguments.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # A single ticket will be a DOCX file.
+    if file_ext == "docx":
+        process_single_ticket(filename, input_file, arguments.streaming)
+
+    # A collection of tickets will be a ZIP file containing a directory with
+    # a single DOCX file for each ticket.
+    elif file_ext == "zip":
+        process_ticket_archive(filename, input_file, workers,
+                               arguments.streaming, not arguments.no_cache,
+                               arguments.format, arguments.pipeline,
+                               arguments.resume, not arguments.watch)
+
+    if arguments.cprofile:
+        profiler.disable()
+        profiler.dump_stats(splitext(filename)[0] + ".prof")
+    if arguments.profile:
+        report_profile(splitext(filename)[0] + "_profile.json")
+
+
+def _find_watched_files(pattern):
+    """
+    Return the DOCX and ZIP files in a directory, or matching a glob
+    pattern, with their sizes and modification times. Word's temporary
+    "~$" files are skipped.
+
+    """
+
+    from glob import glob
+    if isdir(pattern):
+        pattern = join(pattern, "*")
+    found = {}
+    for filename in glob(pattern, recursive = True):
+        if splitext(filename)[-1].lstrip(".").lower() not in ("docx", "zip") \
+          or basename(filename).startswith("~$"):
+            continue
+        try:
+            file_stat = stat(filename)
+        except OSError:
+            continue
+        found[filename] = (file_stat.st_size, file_stat.st_mtime)
+    return found
+
+
+def _has_output(filename, output_format):
+    """
+    Check whether the output for an input file has already been written.
 
-    # Write the details and updates CSV's.
-    details_filename = filename.replace('.zip','_details.csv')
-    updates_filename = filename.replace('.zip','_updates.csv')
-    write_details_CSV(details_filename, details_list)
-    write_updates_CSV(updates_filename, all_updates )
+    """
+
+    if splitext(filename)[-1].lower() == ".docx":
+        return exists(splitext(filename)[0] + ".csv")
+    return exists(splitext(filename)[0] + "_details" +
+                  OUTPUT_EXTENSIONS[output_format])
+
+
+def _poll_watched_files(pattern, output_format, work_queue, interval):
+    """
+    Poll for new (or changed) files, and put them on "work_queue" along
+    with the time they were found. A file is only queued once its size and
+    modification time have stayed the same for one polling interval, so
+    that files that are still being copied in are left alone. Files that
+    are already there when we start are only queued if they have no
+    output yet. When the queue is full, polling waits for it.
 
-else:
-    print('File type "' + file_ext + '" is not supported.')
+    """
+
+    done = {filename: file_state for filename, file_state
+            in _find_watched_files(pattern).items()
+            if _has_output(filename, output_format)}
+    candidates = {}
+    while True:
+        found = _find_watched_files(pattern)
+        for filename, file_state in found.items():
+            if done.get(filename) == file_state:
+                continue
+            if candidates.get(filename, (None,))[0] == file_state:
+                work_queue.put((filename, candidates[filename][1]))
+                done[filename] = file_state
+                del candidates[filename]
+            elif filename not in candidates or \
+              candidates[filename][0] != file_state:
+                candidates[filename] = (file_state, time())
+        sleep(interval)
+
+
+def watch_for_tickets(pattern, arguments, workers=1):
+    """
+    Process ticket files as they're dropped into a directory (or as files
+    matching a glob pattern appear), in this one process, until
+    interrupted. Files are found by polling, in a background thread, and
+    handed to this thread through a bounded queue; the time from finding
+    each file to finishing it is logged. Errors are logged, and never stop
+    (or pause) the watch.
+
+    """
+
+    from queue import Queue
+    from threading import Thread
+    work_queue = Queue(maxsize = WATCH_QUEUE_SIZE)
+    poller = Thread(target = _poll_watched_files,
+                    args = (pattern, arguments.format, work_queue,
+                            WATCH_INTERVAL),
+                    daemon = True)
+    poller.start()
+    print("Watching " + pattern + " (press Ctrl+C to stop)")
     stdout.flush()
-    sleep(5)
+
+    try:
+        while True:
+            filename, found_time = work_queue.get()
+            started = time()
+            try:
+                with ZipFile(filename) as input_file:
+                    process_input_file(filename, input_file, arguments,
+                                       workers)
+            except Exception as e:
+                print("Error processing " + filename + ": " + repr(e))
+            else:
+                finished = time()
+                print("Processed %s in %.2f s (%.2f s after it was found; "
+                      "%d files waiting)" %
+                      (filename, finished - started, finished - found_time,
+                       work_queue.qsize()))
+            stdout.flush()
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+
+def parse_arguments(args):
+    """
+    Parse the command line. The input file is the only positional argument,
+    so dragging and dropping a file onto the executable still works.
+
+    """
+
+    parser = argparse.ArgumentParser(
+        description = "Extract ticket details and status updates from a "
+                      "Word ticket (DOCX) or a ZIP of tickets into CSV files.")
+    parser.add_argument("filename", nargs = "?",
+                        help = "DOCX file (a single ticket) or ZIP of DOCX "
+                               "files (multiple tickets); with --watch, a "
+                               "directory or glob pattern")
+    parser.add_argument("--watch", action = "store_true",
+                        help = "keep running, and process new DOCX and ZIP "
+                               "files as they appear in the directory (or "
+                               "match the glob pattern)")
+    parser.add_argument("--workers", type = int, default = 1, metavar = "N",
+                        help = "number of worker processes used to parse "
+                               "the tickets in a ZIP file (0 uses one per "
+                               "CPU; default: 1)")
+    parser.add_argument("--pipeline", action = "store_true",
+                        help = "read, parse, and write the tickets in a ZIP "
+                               "file in separate stages that run at the same "
+                               "time; with --profile, the queue depths and "
+                               "stalls between the stages are reported")
+    parser.add_argument("--resume", action = "store_true",
+                        help = "carry on with an interrupted run on a ZIP "
+                               "file from its last checkpoint, skipping the "
+                               "tickets already written (CSV output only)")
+    parser.add_argument("--streaming", action = "store_true",
+                        help = "parse each ticket document incrementally, "
+                               "keeping memory use flat for very large "
+                               "tickets")
+    parser.add_argument("--no-cache", action = "store_true",
+                        help = "don't read or update the cache of parsed "
+                               "tickets kept next to a ZIP file's output")
+    parser.add_argument("--format", choices = list(OUTPUT_EXTENSIONS),
+                        default = "csv",
+                        help = "output file format for ZIP files; "
+                               "\"parquet\" and \"arrow\" (Arrow IPC "
+                               "stream) need the pyarrow package (default: "
+                               "csv)")
+    parser.add_argument("--closures", metavar = "FILE",
+                        help = "text file of additional closure dates "
+                               "(YYYY-MM-DD, one per line) to treat as "
+                               "holidays")
+    parser.add_argument("--config", metavar = "FILE",
+                        help = "JSON or TOML (.toml) file of settings that "
+                               "replace the built-in ones: labels, contract "
+                               "prefixes, suspend statuses, MTRF rules, and "
+                               "duty days (including per-site duty days)")
+    parser.add_argument("--profile", action = "store_true",
+                        help = "time each stage of the run, print a summary "
+                               "and the slowest tickets, and save the details "
+                               "to <input name>_profile.json")
+    parser.add_argument("--cprofile", action = "store_true",
+                        help = "run under cProfile and save the statistics "
+                               "to <input name>.prof")
+    parser.add_argument("--startup-timing", action = "store_true",
+                        help = "report how long the imports, setup, and "
+                               "processing took")
+    return parser.parse_args(args)
+
+
+def report_startup_timing():
+    """
+    Print how long each part of the run took, from the start of the script:
+    the imports, the module setup, loading the holiday calendar (if it was
+    needed), and the processing itself. Time spent before the script
+    started (starting the interpreter and, for the executable, unpacking
+    it) isn't included; see "bench/startup_time.py" for that.
+
+    """
+
+    finished = perf_counter()
+    started = STARTUP_TIMES["script started"]
+    print("\nStartup timing (ms):")
+    print("  Imports              %8.1f" %
+          (1000 * (STARTUP_TIMES["imports done"] - started)))
+    print("  Module setup         %8.1f" %
+          (1000 * (STARTUP_TIMES["main started"] -
+                   STARTUP_TIMES["imports done"])))
+    if "holiday calendar" in STARTUP_TIMES:
+        print("  Holiday calendar     %8.1f (during processing)" %
+              (1000 * STARTUP_TIMES["holiday calendar"]))
+    else:
+        print("  Holiday calendar     not needed")
+    print("  Processing           %8.1f" %
+          (1000 * (finished - STARTUP_TIMES["main started"])))
+    print("  Total                %8.1f" % (1000 * (finished - started)))
+
+
+def _exit_on_error(arguments):
+    """
+    Exit after an error. Unless we're in watch mode, we pause first, so
+    that the message can be read before the console window closes (when a
+    file has been dropped onto the executable).
+
+    """
+
+    stdout.flush()
+    if not arguments.watch:
+        sleep(5)
     sys.exit()
 
-print("\nRun completed.\n")
+
+def main():
+
+    STARTUP_TIMES["main started"] = perf_counter()
+    arguments = parse_arguments(argv[1:])
+    workers = arguments.workers
+    if workers == 0:
+        workers = cpu_count() or 1
+
+    # Get the filename from the command line. This could be either a DOCX
+    # file (for a single ticket) or a a ZIP of a DOCX files (for multiple
+    # tickets).
+    filename = arguments.filename
+    if not filename:
+        print("ERROR: No input file specified.")
+        _exit_on_error(arguments)
+
+    # The columnar output formats need an optional package, and can't be
+    # appended to, to resume a run.
+    if arguments.format != "csv" and arguments.resume:
+        print("ERROR: --resume only works with CSV output.")
+        _exit_on_error(arguments)
+    if arguments.format != "csv":
+        try:
+            import pyarrow
+        except ImportError:
+            print('ERROR: The "' + arguments.format + '" format needs the '
+                  'pyarrow package.')
+            _exit_on_error(arguments)
+
+    # Load the config, if there is one.
+    if arguments.config:
+        try:
+            apply_config(load_config(arguments.config))
+        except Exception as e:
+            print("Error reading config file: " + arguments.config)
+            print(e)
+            _exit_on_error(arguments)
+
+    # Load any site-specific closures.
+    if arguments.closures:
+        try:
+            add_closures(load_closures(arguments.closures))
+        except Exception as e:
+            print("Error reading closures file: " + arguments.closures)
+            print(e)
+            _exit_on_error(arguments)
+
+    # In watch mode, we keep going until interrupted.
+    if arguments.watch:
+        watch_for_tickets(filename, arguments, workers)
+        return
+
+    # Read the file--it's going to be in ZIP format either way.
+    try:
+        input_file = ZipFile(filename)
+    except Exception as e:
+        print("Error opening Word document: " + filename)
+        print(e)
+        _exit_on_error(arguments)
+
+    # We can only process DOCX and ZIP files.
+    file_ext = splitext(filename)[-1].lstrip(".").lower()
+    if file_ext not in ("docx", "zip"):
+        print('File type "' + file_ext + '" is not supported.')
+        _exit_on_error(arguments)
+
+    process_input_file(filename, input_file, arguments, workers)
+
+    if arguments.startup_timing:
+        report_startup_timing()
+
+    print("\nRun completed.\n")
+
+
+# The worker processes in parallel mode re-import this file (notably on
+# Windows, and in the PyInstaller executable), so the run itself has to be
+# guarded.
+if __name__ == "__main__":
+    # In the PyInstaller executable, the worker processes start here.
+    if getattr(sys, "frozen", False):
+        from multiprocessing import freeze_support
+        freeze_support()
+    main()